@@ -0,0 +1,311 @@
+from typing import Dict, List, Optional, Set, Tuple
+import sys
+
+import numpy as np
+
+POST = 0
+COMMENT = 1
+KIND_NAMES = ('post', 'comment')
+
+# String fields live back to back in one buffer, addressed by offsets
+STRING_FIELDS = ('id', 'title', 'text', 'url')
+
+# Bit per known key, so items round-trip with exactly the keys they had
+_KEYS = STRING_FIELDS + ('created_utc', 'subreddit', 'upvotes', 'type')
+_BIT = {key: 1 << i for i, key in enumerate(_KEYS)}
+
+
+class ActivityFrame:
+    """Columnar, array-backed view of a user's posts and comments.
+
+    One row per item, posts first then comments, in their original order:
+
+    - ``created_utc`` float64 (NaN when missing) and ``upvotes`` int64 (0 when missing)
+    - ``subreddit_ids`` int32 indexes into ``subreddits``, one interned string
+      per distinct subreddit (``None`` when the item had no subreddit)
+    - ``kinds`` int8, ``POST`` or ``COMMENT``
+    - ``offsets`` int64 into ``buffer``; field ``j`` of row ``i`` is
+      ``buffer[offsets[i * F + j]:offsets[i * F + j + 1]]``
+    - ``present`` uint8 bitmask of the keys each item actually had
+
+    ``RedditScraper`` builds frames directly with ``ActivityFrameBuilder``.
+    ``from_items`` / ``to_items`` round-trip to equal dict lists: absent keys
+    stay absent, and unknown keys as well as values the columns can't hold
+    exactly (``None``, other types, a ``type`` that disagrees with the list
+    the item came in) are kept aside in ``extras``.
+    """
+
+    def __init__(self, created_utc: np.ndarray, upvotes: np.ndarray, subreddit_ids: np.ndarray,
+                 subreddits: List[Optional[str]], kinds: np.ndarray, buffer: str,
+                 offsets: np.ndarray, present: np.ndarray, extras: Optional[Dict[int, Dict]] = None):
+        self.created_utc = created_utc
+        self.upvotes = upvotes
+        self.subreddit_ids = subreddit_ids
+        self.subreddits = subreddits
+        self.kinds = kinds
+        self.buffer = buffer
+        self.offsets = offsets
+        self.present = present
+        self.extras = extras or {}
+        self._lowered: Dict[Tuple[str, ...], List[str]] = {}
+
+    @classmethod
+    def from_items(cls, posts: List[Dict], comments: List[Dict]) -> 'ActivityFrame':
+        """Build a frame from ``(posts, comments)`` dict lists."""
+        builder = ActivityFrameBuilder()
+        for item in posts:
+            builder.add_item(item, POST)
+        for item in comments:
+            builder.add_item(item, COMMENT)
+        return builder.build()
+
+    @classmethod
+    def concat(cls, frames: List['ActivityFrame']) -> 'ActivityFrame':
+        """Join frames into one: every frame's posts, then every frame's comments.
+
+        Each frame's posts and comments are contiguous runs of its buffer, so
+        this copies whole slices instead of walking the rows.
+        """
+        F = len(STRING_FIELDS)
+        vocab: Dict[Optional[str], int] = {}
+        columns = {name: [] for name in ('created_utc', 'upvotes', 'subreddit_ids', 'kinds', 'present', 'lengths')}
+        buffers = []
+        extras = {}
+        row = 0
+        for kind in (POST, COMMENT):
+            for frame in frames:
+                n_posts = int(np.count_nonzero(frame.kinds == POST))
+                start, stop = (0, n_posts) if kind == POST else (n_posts, len(frame))
+                if start == stop:
+                    continue
+                sub_map = np.array([vocab.setdefault(name, len(vocab)) for name in frame.subreddits],
+                                   dtype=np.int32)
+                columns['created_utc'].append(frame.created_utc[start:stop])
+                columns['upvotes'].append(frame.upvotes[start:stop])
+                columns['subreddit_ids'].append(sub_map[frame.subreddit_ids[start:stop]])
+                columns['kinds'].append(frame.kinds[start:stop])
+                columns['present'].append(frame.present[start:stop])
+                columns['lengths'].append(np.diff(frame.offsets[start * F:stop * F + 1]))
+                buffers.append(frame.buffer[frame.offsets[start * F]:frame.offsets[stop * F]])
+                for index, extra in frame.extras.items():
+                    if start <= index < stop:
+                        extras[row + index - start] = extra
+                row += stop - start
+
+        if not row:
+            return ActivityFrameBuilder().build()
+        lengths = np.concatenate(columns['lengths'])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(np.concatenate(columns['created_utc']), np.concatenate(columns['upvotes']),
+                   np.concatenate(columns['subreddit_ids']), list(vocab), np.concatenate(columns['kinds']),
+                   ''.join(buffers), offsets, np.concatenate(columns['present']), extras)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def field(self, index: int, name: str) -> str:
+        """Return a string field of one row ('' when the item didn't have it)."""
+        slot = index * len(STRING_FIELDS) + STRING_FIELDS.index(name)
+        return self.buffer[self.offsets[slot]:self.offsets[slot + 1]]
+
+    def has(self, index: int, key: str) -> bool:
+        """Whether row ``index`` had ``key`` at all (as opposed to an empty value)."""
+        return bool(self.present[index] & _BIT[key])
+
+    def strings(self, name: str) -> List[str]:
+        """One string field for every row, in row order."""
+        F = len(STRING_FIELDS)
+        j = STRING_FIELDS.index(name)
+        starts = self.offsets[j:-1:F].tolist()
+        ends = self.offsets[j + 1::F].tolist()
+        return [self.buffer[start:end] for start, end in zip(starts, ends)]
+
+    def lowered(self, *names: str) -> List[str]:
+        """Per-row lowercase text of the ``names`` fields joined by spaces, for keyword scans.
+
+        Cached, so the many heuristics scanning the same text lowercase it once.
+        """
+        if names not in self._lowered:
+            columns = [self.strings(name) for name in names]
+            self._lowered[names] = [' '.join(values).lower() for values in zip(*columns)]
+        return self._lowered[names]
+
+    def subreddit(self, index: int) -> Optional[str]:
+        return self.subreddits[self.subreddit_ids[index]]
+
+    def item(self, index: int) -> Dict:
+        """Rebuild the original dict for one row."""
+        mask = int(self.present[index])
+        item = {}
+        for key in _KEYS:
+            if not mask & _BIT[key]:
+                continue
+            if key in STRING_FIELDS:
+                item[key] = self.field(index, key)
+            elif key == 'created_utc':
+                item[key] = float(self.created_utc[index])
+            elif key == 'upvotes':
+                item[key] = int(self.upvotes[index])
+            elif key == 'subreddit':
+                item[key] = self.subreddit(index)
+            else:
+                item[key] = KIND_NAMES[self.kinds[index]]
+        item.update(self.extras.get(index, {}))
+        return item
+
+    def to_items(self) -> Tuple[List[Dict], List[Dict]]:
+        """Rebuild the ``(posts, comments)`` dict lists."""
+        items = [self.item(i) for i in range(len(self))]
+        n_posts = int(np.count_nonzero(self.kinds == POST))
+        return items[:n_posts], items[n_posts:]
+
+    def indices(self, kind: Optional[int] = None) -> np.ndarray:
+        """Row indices, optionally restricted to ``POST`` or ``COMMENT``."""
+        if kind is None:
+            return np.arange(len(self))
+        return np.flatnonzero(self.kinds == kind)
+
+    def hour_histogram(self) -> np.ndarray:
+        """Activity counts per UTC hour of day, for items with a timestamp."""
+        times = self.created_utc[~np.isnan(self.created_utc)]
+        hours = (np.floor_divide(times, 3600) % 24).astype(np.int64)
+        return np.bincount(hours, minlength=24)
+
+    def subreddit_counts(self) -> Dict[str, int]:
+        """Items per subreddit, in first-appearance order ('unknown' when missing)."""
+        counts = {}
+        for sub_id, count in enumerate(np.bincount(self.subreddit_ids, minlength=len(self.subreddits))):
+            if count:
+                name = self.subreddits[sub_id]
+                name = 'unknown' if name is None else name
+                counts[name] = counts.get(name, 0) + int(count)
+        return counts
+
+    def top_k(self, k: int, kind: Optional[int] = None) -> np.ndarray:
+        """Indices of the ``k`` most upvoted rows, highest first.
+
+        Ties keep their original order, matching a stable
+        ``sorted(..., key=upvotes, reverse=True)[:k]``.
+        """
+        rows = self.indices(kind)
+        if k <= 0 or not len(rows):
+            return rows[:0]
+        scores = -self.upvotes[rows]
+        if k < len(rows):
+            # Keep everything at least as good as the k-th best, ties included
+            kth = np.partition(scores, k - 1)[k - 1]
+            rows = rows[scores <= kth]
+            scores = scores[scores <= kth]
+        return rows[np.argsort(scores, kind='stable')[:k]]
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, bool)
+
+
+class ActivityFrameBuilder:
+    """Accumulates rows for an ``ActivityFrame`` without building a dict per item.
+
+    Rows can be added in any order; ``build`` lays out posts before comments,
+    each in the order they were added.
+    """
+
+    def __init__(self):
+        self._rows = ([], [])
+
+    def __len__(self) -> int:
+        return len(self._rows[POST]) + len(self._rows[COMMENT])
+
+    def add(self, kind: int, id: Optional[str] = None, title: Optional[str] = None,
+            text: Optional[str] = None, url: Optional[str] = None, created_utc: Optional[float] = None,
+            subreddit: Optional[str] = None, upvotes: Optional[int] = None):
+        """Add one ``POST`` or ``COMMENT``; fields left as None are absent from the row."""
+        strings = (id, title, text, url)
+        mask = _BIT['type']
+        for field, value in zip(STRING_FIELDS, strings):
+            if value is not None:
+                mask |= _BIT[field]
+        if created_utc is not None:
+            mask |= _BIT['created_utc']
+        if subreddit is not None:
+            mask |= _BIT['subreddit']
+        if upvotes is not None:
+            mask |= _BIT['upvotes']
+        self._rows[kind].append((strings, created_utc, upvotes, subreddit, mask, None))
+
+    def add_item(self, item: Dict, kind: int):
+        """Add one scraper-style dict, remembering exactly which keys and values it had.
+
+        Values the columns can't hold exactly also go into the row's extras,
+        which ``ActivityFrame.item`` lays over the column values.
+        """
+        mask = 0
+        for key in _KEYS:
+            if key in item:
+                mask |= _BIT[key]
+        extra = {k: v for k, v in item.items() if k not in _BIT}
+
+        strings = []
+        for field in STRING_FIELDS:
+            value = item.get(field)
+            if field in item and not isinstance(value, str):
+                extra[field] = value
+                value = None
+            strings.append(value)
+        created_utc, upvotes = item.get('created_utc'), item.get('upvotes')
+        if 'created_utc' in item and type(created_utc) is not float:
+            extra['created_utc'] = created_utc
+            created_utc = float(created_utc) if _is_number(created_utc) else None
+        if 'upvotes' in item and type(upvotes) is not int:
+            extra['upvotes'] = upvotes
+            upvotes = int(upvotes) if _is_number(upvotes) and np.isfinite(upvotes) else None
+        subreddit = item.get('subreddit')
+        if subreddit is not None and not isinstance(subreddit, str):
+            extra['subreddit'] = subreddit
+            subreddit = None
+        if 'type' in item and item['type'] != KIND_NAMES[kind]:
+            extra['type'] = item['type']
+        self._rows[kind].append((tuple(strings), created_utc, upvotes, subreddit, mask, extra or None))
+
+    def build(self, exclude: Optional[Set[str]] = None) -> ActivityFrame:
+        """Lay the rows out as a frame, leaving out rows whose id or url is in ``exclude``."""
+        posts, comments = self._rows
+        if exclude:
+            posts = [row for row in posts if (row[0][0] or row[0][3]) not in exclude]
+            comments = [row for row in comments if (row[0][0] or row[0][3]) not in exclude]
+        n = len(posts) + len(comments)
+        created_utc = np.full(n, np.nan, dtype=np.float64)
+        upvotes = np.zeros(n, dtype=np.int64)
+        subreddit_ids = np.zeros(n, dtype=np.int32)
+        kinds = np.empty(n, dtype=np.int8)
+        kinds[:len(posts)] = POST
+        kinds[len(posts):] = COMMENT
+        present = np.zeros(n, dtype=np.uint8)
+
+        vocab: Dict[Optional[str], int] = {}
+        strings = []
+        lengths = []
+        extras = {}
+        for i, (values, created, score, subreddit, mask, extra) in enumerate(posts + comments):
+            for value in values:
+                if value is None:
+                    lengths.append(0)
+                else:
+                    strings.append(value)
+                    lengths.append(len(value))
+            if created is not None:
+                created_utc[i] = created
+            if score is not None:
+                upvotes[i] = score
+            if isinstance(subreddit, str):
+                subreddit = sys.intern(subreddit)
+            subreddit_ids[i] = vocab.setdefault(subreddit, len(vocab))
+            present[i] = mask
+            if extra:
+                extras[i] = extra
+
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return ActivityFrame(created_utc, upvotes, subreddit_ids, list(vocab), kinds,
+                             ''.join(strings), offsets, present, extras)
@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from activity_frame import ActivityFrame, ActivityFrameBuilder
+from reddit_scraper import RedditScraper
+from persona_template import PersonaGenerator
+
+# Seconds covered by each praw time_filter, used to window non-"top" listings
+WINDOWS = {
+    'hour': 3600,
+    'day': 86400,
+    'week': 7 * 86400,
+    'month': 30 * 86400,
+    'year': 365 * 86400,
+    'all': None,
+}
+
+# Accounts that show up everywhere but aren't community members
+IGNORED_AUTHORS = {'AutoModerator', '[deleted]'}
+
+
+class CohortBuilder:
+    """Generate personas for the top contributors of a subreddit.
+
+    Discovery walks the subreddit's listings once, deduplicating submissions
+    that appear in several listings, and keeps every item it fetched grouped
+    by author. That activity is merged into each member's history frame so
+    it is never fetched twice; with ``fetch_history=False`` it is used on its
+    own.
+
+    praw.Reddit instances aren't thread-safe, so every fetch thread gets its
+    own scraper from ``scraper_factory``; ``scraper``, if given, is used by
+    the calling thread.
+    """
+
+    def __init__(self, scraper: Optional[RedditScraper] = None,
+                 generator: Optional[PersonaGenerator] = None,
+                 max_workers: int = 8,
+                 scraper_factory: Optional[Callable[[], RedditScraper]] = None):
+        self._scraper_factory = scraper_factory or (lambda: RedditScraper(priority='bulk'))
+        self._local = threading.local()
+        if scraper is not None:
+            self._local.scraper = scraper
+        self.generator = generator or PersonaGenerator()
+        self.max_workers = max_workers
+
+    @property
+    def scraper(self) -> RedditScraper:
+        """This thread's scraper."""
+        scraper = getattr(self._local, 'scraper', None)
+        if scraper is None:
+            scraper = self._local.scraper = self._scraper_factory()
+        return scraper
+
+    def build(self, subreddit: str, top_n: int = 25, window: str = 'week',
+              post_limit: int = 100, listings: Tuple[str, ...] = ('top', 'hot'),
+              fetch_history: bool = True, batch_job: bool = False,
+              on_member: Optional[Callable[[str, Dict, ActivityFrame], None]] = None) -> Dict:
+        """Discover the top ``top_n`` contributors and generate their personas.
+
+        With ``batch_job`` the personas are generated through an offline
+        Together batch job, which is cheaper but can take hours.
+        ``on_member(username, persona, frame)`` is called for each member with
+        the activity their persona was built from, e.g. to store it.
+        """
+        if window not in WINDOWS:
+            raise ValueError(f"Unknown window '{window}', expected one of {', '.join(WINDOWS)}")
+        if top_n <= 0:
+            raise ValueError("top_n must be positive")
+
+        activity = self.discover(subreddit, window, post_limit, listings)
+        ranked = sorted(activity.items(), key=lambda x: len(x[1]), reverse=True)
+        members = ranked[:top_n]
+        print(f"Found {len(activity)} contributors in r/{subreddit}, building {len(members)} personas...")
+
+        def fetch_member(entry):
+            username, discovered = entry
+            if fetch_history:
+                return username, self._merge_history(username, discovered)
+            return username, discovered.build()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            histories = list(executor.map(fetch_member, members))
+
+        # One concurrent LLM pass for the whole cohort instead of a call per fetch thread
+        personas = self.generator.generate_personas_batch(histories, use_batch_job=batch_job)
+        if on_member is not None:
+            for (username, frame), persona in zip(histories, personas):
+                on_member(username, persona, frame)
+        results = [
+            {
+                'username': username,
+                'discovered_activity': len(discovered),
+                'total_activity': len(frame),
+                'persona': persona,
+            }
+            for (_, discovered), (username, frame), persona in zip(members, histories, personas)
+        ]
+
+        return {
+            'subreddit': subreddit,
+            'window': window,
+            'contributors_found': len(activity),
+            'members': results,
+            'aggregates': self._aggregate(subreddit, [frame for _, frame in histories]),
+        }
+
+    def discover(self, subreddit: str, window: str = 'week', post_limit: int = 100,
+                 listings: Tuple[str, ...] = ('top', 'hot')) -> Dict[str, ActivityFrameBuilder]:
+        """Return ``{author: activity}`` for everything active in the window."""
+        if not self.scraper.api_available:
+            print("Cohort discovery requires the Reddit API; no contributors found.")
+            return {}
+
+        sub = self.scraper.reddit.subreddit(subreddit)
+        cutoff = time.time() - WINDOWS[window] if WINDOWS[window] else 0
+
+        submissions = {}
+        for listing in listings:
+            try:
+                if listing == 'top':
+                    items = sub.top(time_filter=window, limit=post_limit)
+                else:
+                    items = getattr(sub, listing)(limit=post_limit)
+                for submission in items:
+                    # Listings overlap heavily; each submission is processed once
+                    if submission.id not in submissions and submission.created_utc >= cutoff:
+                        submissions[submission.id] = submission
+            except Exception as e:
+                print(f"Error reading r/{subreddit}/{listing}: {e}")
+
+        activity: Dict[str, ActivityFrameBuilder] = {}
+        seen_comments = set()
+
+        def member(author) -> Optional[ActivityFrameBuilder]:
+            name = str(author) if author else None
+            if not name or name in IGNORED_AUTHORS:
+                return None
+            return activity.setdefault(name, ActivityFrameBuilder())
+
+        for submission in submissions.values():
+            builder = member(submission.author)
+            if builder is not None:
+                self.scraper.add_post(builder, submission)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for comment_list in executor.map(self._fetch_comments, submissions.values()):
+                for comment in comment_list:
+                    if comment.id in seen_comments or comment.created_utc < cutoff:
+                        continue
+                    seen_comments.add(comment.id)
+                    builder = member(comment.author)
+                    if builder is not None:
+                        self.scraper.add_comment(builder, comment)
+
+        return activity
+
+    def _fetch_comments(self, submission) -> List:
+        """Fetch a submission's loaded comment tree, skipping 'load more' stubs."""
+        try:
+            # Listed by another thread's praw instance; fetch through this thread's own
+            submission = self.scraper.reddit.submission(id=submission.id)
+            submission.comments.replace_more(limit=0)
+            return submission.comments.list()
+        except Exception as e:
+            print(f"Error fetching comments for {submission.id}: {e}")
+            return []
+
+    def _merge_history(self, username: str, discovered: ActivityFrameBuilder) -> ActivityFrame:
+        """Add the user's own history, keeping discovered items it doesn't include."""
+        history = self.scraper.get_user_frame(username)
+        known = {item_id or url for item_id, url in zip(history.strings('id'), history.strings('url'))}
+        return ActivityFrame.concat([history, discovered.build(exclude=known)])
+
+    def _aggregate(self, subreddit: str, frames: List[ActivityFrame]) -> Dict:
+        """Cohort-level subreddit overlap and posting-hour histogram."""
+        overlap = Counter()
+        hours = np.zeros(24, dtype=np.int64)
+        for frame in frames:
+            overlap.update(frame.subreddit_counts().keys())
+            hours += frame.hour_histogram()
+
+        size = len(frames) or 1
+        return {
+            'member_count': len(frames),
+            'subreddit_overlap': [
+                {'subreddit': name, 'members': count, 'share': round(count / size, 3)}
+                for name, count in overlap.most_common(25)
+                if name.lower() != subreddit.lower()
+            ],
+            'hour_histogram_utc': hours.tolist(),
+        }
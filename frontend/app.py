@@ -3,17 +3,28 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import tempfile
 import shutil
+import threading
+import time
 import json
 import uuid
 import base64
 import atexit
-from flask import Flask, request, jsonify, send_file, render_template, send_from_directory
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify, send_file, render_template, send_from_directory, stream_with_context
 from werkzeug.middleware.proxy_fix import ProxyFix
 from fpdf import FPDF, HTMLMixin
 from PIL import Image, ImageDraw, ImageFont
 from html2image import Html2Image
 from persona_template import PersonaGenerator
 from reddit_scraper import RedditScraper
+from cohort import CohortBuilder, WINDOWS
+from persona_export import FORMATS, iter_records, iter_jsonl, parse_time, write_parquet
+from persona_store import PersonaStore, FreshnessPolicy, BackgroundRefresher
+from rate_limiter import get_scheduler
+from activity_frame import ActivityFrameBuilder, POST
+from timeline import build_timeline
+from single_flight import SingleFlight, normalize_username
+from subreddit_taxonomy import get_taxonomy
 
 class PDF(FPDF, HTMLMixin):
     pass
@@ -26,69 +37,433 @@ UPLOAD_FOLDER = 'temp_uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Coalesces concurrent /generate requests for the same username
+inflight = SingleFlight(grace_period=float(os.getenv('PERSONA_COALESCE_GRACE', 10)))
+
+# Stored personas are served directly while fresh (stale-while-revalidate)
+store = PersonaStore(UPLOAD_FOLDER)
+freshness = FreshnessPolicy()
+
+# How long other worker processes wait on one worker's build of a user
+BUILD_LEASE = float(os.getenv('PERSONA_BUILD_LEASE', 180))
+
+def _create_screenshot_client():
+    """Create the HTML to image converter, falling back to a blank card."""
+    try:
+        return Html2Image(
+            output_path=TEMP_DIR,
+            size=(1600, 900),
+            browser_executable='google-chrome' if os.name == 'posix' else None
+        )
+    except Exception as e:
+        print(f"Html2Image initialization failed, using fallback: {e}")
+        class SimpleScreenshot:
+            def screenshot(self, html_file=None, save_as=None, size=None):
+                img = Image.new('RGB', size or (1600, 900), color=(255, 255, 255))
+                d = ImageDraw.Draw(img)
+                try:
+                    font = ImageFont.truetype("arial.ttf", 24)
+                except:
+                    font = ImageFont.load_default()
+                d.text((100, 100), "Persona Card", fill=(0, 0, 0), font=font)
+                img.save(os.path.join(TEMP_DIR, save_as))
+        
+        return SimpleScreenshot()
+
 # Initialize HTML to image converter
-try:
-    hti = Html2Image(
-        output_path=TEMP_DIR,
-        size=(1600, 900),
-        browser_executable='google-chrome' if os.name == 'posix' else None
-    )
-except Exception as e:
-    print(f"Html2Image initialization failed, using fallback: {e}")
-    class SimpleScreenshot:
-        def screenshot(self, html_file=None, save_as=None, size=None):
-            img = Image.new('RGB', size or (1600, 900), color=(255, 255, 255))
-            d = ImageDraw.Draw(img)
+hti = _create_screenshot_client()
+
+# Per-process shared clients, created lazily or by init_worker() after fork
+_local = threading.local()
+_init_lock = threading.Lock()
+_generator = None
+_refresher = None
+_ready = False
+
+def get_scraper(priority: str = 'interactive') -> RedditScraper:
+    """Return this thread's Reddit scraper for a rate-limit priority class.
+
+    praw.Reddit instances aren't thread-safe, so every server thread gets its
+    own; they all draw from the same host-wide rate limiter.
+    """
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.scrapers = {}
+        _local.pid = os.getpid()
+    if priority not in _local.scrapers:
+        _local.scrapers[priority] = RedditScraper(priority=priority)
+    return _local.scrapers[priority]
+
+def get_generator() -> PersonaGenerator:
+    """Return this process's shared persona generator."""
+    global _generator
+    with _init_lock:
+        if _generator is None:
+            _generator = PersonaGenerator()
+        return _generator
+
+def get_refresher() -> BackgroundRefresher:
+    """Return this process's background refresher, starting it on first use."""
+    global _refresher
+    with _init_lock:
+        if _refresher is None:
+            _refresher = BackgroundRefresher(
+                store, freshness,
+                rebuild=lambda username: inflight.do(normalize_username(username),
+                                                     lambda: _build_persona(username, 'bulk')))
+            _refresher.start()
+        return _refresher
+
+def init_worker():
+    """Initialize per-process state after a pre-forking server forks.
+
+    Sockets, browser handles and temp dirs must not be shared between
+    workers, so each worker gets its own.
+    """
+    global TEMP_DIR, hti, _generator, _refresher, _ready
+    _ready = False
+    TEMP_DIR = tempfile.mkdtemp()
+    hti = _create_screenshot_client()
+    get_scraper('interactive')
+    _generator = PersonaGenerator()
+    # Threads don't survive fork; the worker starts its own once warmed up
+    _refresher = None
+
+def warmup():
+    """Exercise the slow first-request paths so real requests don't pay for them."""
+    global _ready
+    sample = ActivityFrameBuilder()
+    sample.add(POST, title='Warmup', text='warmup post', created_utc=0, subreddit='warmup', upvotes=1, url='')
+    try:
+        # Map (compiling if needed) the subreddit taxonomy before the first request
+        get_taxonomy()
+        generator = get_generator()
+        persona_data = generator._heuristic_analysis_json('warmup', sample.build())
+        persona_data['id'] = 'warmup'
+        with app.test_request_context():
+            render_template('index.html')
+            html_content = render_template('persona_card.html', persona=persona_data)
+        html_path = os.path.join(TEMP_DIR, 'warmup.html')
+        with open(html_path, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        hti.screenshot(html_file=html_path, save_as='warmup.jpg', size=(1600, 1200))
+    except Exception as e:
+        print(f"Warmup failed: {e}")
+    finally:
+        for file_path in (os.path.join(TEMP_DIR, 'warmup.html'), os.path.join(TEMP_DIR, 'warmup.jpg')):
             try:
-                font = ImageFont.truetype("arial.ttf", 24)
+                if os.path.exists(file_path):
+                    os.remove(file_path)
             except:
-                font = ImageFont.load_default()
-            d.text((100, 100), "Persona Card", fill=(0, 0, 0), font=font)
-            img.save(os.path.join(TEMP_DIR, save_as))
-    
-    hti = SimpleScreenshot()
+                pass
+    _ready = True
+
+def create_app() -> Flask:
+    """WSGI app factory: initialize this process and return the warmed-up app."""
+    init_worker()
+    warmup()
+    get_refresher()
+    return app
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
+def _build_persona(username: str, priority: str = 'interactive', progressive: bool = False):
+    """Scrape, analyze and store a persona. Returns None if the user has no data.
+
+    With ``progressive`` the heuristic persona is stored and returned straight
+    away, and replaced in place once the LLM version is ready.
+    """
+    scraper = get_scraper(priority)
+    frame = scraper.get_user_frame(username)
+    
+    if not len(frame):
+        return None
+    
+    key = normalize_username(username)
+    generator = get_generator()
+    saved = threading.Event()
+    if progressive:
+        def on_upgrade(fields):
+            # The upgrade must land on top of the heuristic persona, not race it
+            saved.wait(60)
+            row = store.lookup(key, count_hit=False)
+            current = store.load(row['persona_id']) if row else None
+            if current is not None:
+                current.update(fields)
+                store.save(key, current)
+        persona_data = generator.generate_persona_progressive(username, frame, on_upgrade)
+    else:
+        persona_data = generator.generate_persona_json(username, frame)
+    
+    # Get Reddit profile photo
+    try:
+        redditor = scraper.reddit.redditor(username)
+        if hasattr(redditor, 'icon_img') and redditor.icon_img:
+            photo_url = redditor.icon_img.split('?')[0]
+            persona_data['photo'] = photo_url
+    except Exception as e:
+        print(f"Couldn't fetch Reddit avatar: {e}")
+        persona_data['photo'] = generator._generate_svg_avatar(username)
+    
+    try:
+        return store.save(key, persona_data, username, activity=frame)
+    finally:
+        saved.set()
+
+def _build_persona_once(username: str, progressive: bool = False):
+    """Build a persona unless another worker process is already building it.
+
+    SingleFlight only coalesces within a process; this lease in the store
+    makes the other workers wait for that build's result instead of running
+    their own scrape + LLM call.
+    """
+    key = normalize_username(username)
+    started = time.time()
+    lease = store.claim_build(key, BUILD_LEASE)
+    if lease is None:
+        row = store.wait_for_build(key, started, BUILD_LEASE)
+        persona_data = store.load(row['persona_id']) if row is not None else None
+        if persona_data is not None:
+            return persona_data
+        # The other build found nothing or failed: try ourselves. If yet another
+        # worker claimed it in the meantime we still build, but leave its lease alone.
+        lease = store.claim_build(key, BUILD_LEASE)
+    try:
+        return _build_persona(username, progressive=progressive)
+    finally:
+        if lease is not None:
+            store.release_build(key, lease)
+
 @app.route('/generate', methods=['POST'])
 def generate():
     username = request.form.get('username', '').strip()
     if not username:
         return jsonify({'error': 'Username is required'}), 400
+    progressive = request.form.get('mode') == 'progressive'
     
     try:
-        scraper = RedditScraper()
-        posts, comments = scraper.get_user_data(username)
+        key = normalize_username(username)
+        row = store.lookup(key)
+        if row is not None:
+            state = freshness.state(row['generated_at'])
+            persona_data = store.load(row['persona_id']) if state != freshness.EXPIRED else None
+            if persona_data is not None:
+                # Heuristic personas (the LLM was unavailable) are served but rebuilt like stale ones
+                if (state == freshness.FRESH and persona_data.get('tier') == 'heuristic'
+                        and not persona_data.get('upgrading')):
+                    state = freshness.STALE
+                refreshing = state == freshness.STALE and get_refresher().enqueue(key)
+                persona_data['freshness'] = freshness.describe(row['generated_at'], state, refreshing)
+                return jsonify(persona_data)
         
-        if not posts and not comments:
-            return jsonify({'error': 'No data found for this user'}), 404
-        
-        generator = PersonaGenerator()
-        persona_data = generator.generate_persona_json(username, posts, comments)
-        
-        # Get Reddit profile photo
-        try:
-            redditor = scraper.reddit.redditor(username)
-            if hasattr(redditor, 'icon_img') and redditor.icon_img:
-                photo_url = redditor.icon_img.split('?')[0]
-                persona_data['photo'] = photo_url
-        except Exception as e:
-            print(f"Couldn't fetch Reddit avatar: {e}")
-            persona_data['photo'] = generator._generate_svg_avatar(username)
+        # Concurrent requests for the same user share one scrape + LLM run, whichever mode started it
+        persona_data = inflight.do(key, lambda: _build_persona_once(username, progressive=progressive))
         
-        persona_data['id'] = str(uuid.uuid4())
-        
-        json_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{persona_data["id"]}.json')
-        with open(json_path, 'w') as f:
-            json.dump(persona_data, f)
+        if persona_data is None:
+            return jsonify({'error': 'No data found for this user'}), 404
         
-        return jsonify(persona_data)
+        row = store.lookup(key, count_hit=False)
+        return jsonify(dict(persona_data, freshness=freshness.describe(row['generated_at'], 'new')))
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/status/<persona_id>')
+def persona_status(persona_id):
+    persona_data = store.load(persona_id) if os.path.exists(store.json_path(persona_id)) else None
+    if persona_data is None:
+        return jsonify({'error': 'Persona data not found'}), 404
+    return jsonify({
+        'id': persona_id,
+        'tier': persona_data.get('tier', 'llm'),
+        'upgrading': bool(persona_data.get('upgrading')),
+    })
+
+@app.route('/events/<persona_id>')
+def persona_events(persona_id):
+    """Server-sent events: the persona now, then again each time it is rewritten until upgraded."""
+    json_path = store.json_path(persona_id)
+    if not os.path.exists(json_path):
+        return jsonify({'error': 'Persona data not found'}), 404
+    try:
+        timeout = float(request.args.get('timeout', 120))
+    except ValueError:
+        return jsonify({'error': 'timeout must be a number of seconds'}), 400
+    if not 0 < timeout:
+        return jsonify({'error': 'timeout must be positive'}), 400
+    timeout = min(timeout, 600)
+    
+    def stream():
+        deadline = time.time() + timeout
+        last_mtime = None
+        last_sent = time.time()
+        while time.time() < deadline:
+            try:
+                mtime = os.path.getmtime(json_path)
+            except OSError:
+                mtime = last_mtime
+            if mtime != last_mtime:
+                last_mtime = mtime
+                persona_data = store.load(persona_id)
+                if persona_data is not None:
+                    yield f"event: persona\ndata: {json.dumps(persona_data)}\n\n"
+                    last_sent = time.time()
+                    if not persona_data.get('upgrading'):
+                        return
+            elif time.time() - last_sent > 15:
+                # Keep proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                last_sent = time.time()
+            time.sleep(0.5)
+        yield "event: timeout\ndata: {}\n\n"
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/timeline/<username>')
+def timeline(username):
+    key = normalize_username(username)
+    if not key:
+        return jsonify({'error': 'Username is required'}), 400
+    
+    # A fresh stored persona already carries its timeline
+    row = store.lookup(key, count_hit=False)
+    if row is not None and freshness.state(row['generated_at']) == freshness.FRESH:
+        persona_data = store.load(row['persona_id'])
+        if persona_data and 'timeline' in persona_data:
+            return jsonify({'username': username, 'timeline': persona_data['timeline']})
     
+    def build():
+        frame = get_scraper().get_user_frame(username)
+        if not len(frame):
+            return None
+        return build_timeline(frame)
+    
+    try:
+        timeline_data = inflight.do(f"timeline:{key}", build)
+        if timeline_data is None:
+            return jsonify({'error': 'No data found for this user'}), 404
+        return jsonify({'username': username, 'timeline': timeline_data})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def cohort_job_path(job_id: str) -> str:
+    return os.path.join(UPLOAD_FOLDER, f'cohort_{job_id}.json')
+
+def _write_cohort_job(job: dict):
+    # Job state lives on disk so any worker process can answer status requests
+    tmp_path = cohort_job_path(job['id']) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp_path, cohort_job_path(job['id']))
+
+_cohort_pool = None
+_cohort_pool_pid = None
+_cohort_jobs = {}
+
+def get_cohort_pool() -> ThreadPoolExecutor:
+    """This process's cohort job threads (threads don't survive fork)."""
+    global _cohort_pool, _cohort_pool_pid
+    with _init_lock:
+        if _cohort_pool is None or _cohort_pool_pid != os.getpid():
+            _cohort_pool = ThreadPoolExecutor(max_workers=int(os.getenv('COHORT_JOB_WORKERS', 1)),
+                                              thread_name_prefix='cohort-job')
+            _cohort_pool_pid = os.getpid()
+            _cohort_jobs.clear()
+        return _cohort_pool
+
+def _run_cohort_job(job: dict, key: str):
+    job.update(status='running', started_at=time.time())
+    _write_cohort_job(job)
+    try:
+        builder = CohortBuilder(generator=get_generator(), scraper_factory=lambda: get_scraper('bulk'))
+        # Store each persona with its activity so the usual download links and exports work
+        cohort_data = builder.build(
+            job['subreddit'], top_n=job['top'], window=job['window'], fetch_history=job['history'],
+            on_member=lambda username, persona, frame: store.save(
+                normalize_username(username), persona, username, activity=frame))
+        job.update(status='done', result=cohort_data)
+    except Exception as e:
+        job.update(status='failed', error=str(e))
+    finally:
+        job['finished_at'] = time.time()
+        _write_cohort_job(job)
+        _cohort_jobs.pop(key, None)
+
+@app.route('/cohort', methods=['POST'])
+def cohort():
+    """Start building a cohort in the background; poll ``/cohort/<id>`` for the result."""
+    subreddit = request.form.get('subreddit', '').strip().strip('/').split('/')[-1]
+    if not subreddit:
+        return jsonify({'error': 'Subreddit is required'}), 400
+    
+    window = request.form.get('window', 'week')
+    if window not in WINDOWS:
+        return jsonify({'error': f"Window must be one of {', '.join(WINDOWS)}"}), 400
+    
+    try:
+        top_n = min(int(request.form.get('top', 25)), int(os.getenv('COHORT_MAX_USERS', 500)))
+        fetch_history = request.form.get('history', 'true').lower() != 'false'
+    except ValueError:
+        return jsonify({'error': 'top must be an integer'}), 400
+    if top_n <= 0:
+        return jsonify({'error': 'top must be a positive integer'}), 400
+    
+    # An identical cohort already being built in this process is shared
+    key = f"{subreddit.lower()}:{window}:{top_n}:{fetch_history}"
+    pool = get_cohort_pool()
+    with _init_lock:
+        job = _cohort_jobs.get(key)
+        if job is None:
+            job = {'id': str(uuid.uuid4()), 'status': 'queued', 'subreddit': subreddit, 'window': window,
+                   'top': top_n, 'history': fetch_history, 'created_at': time.time()}
+            _write_cohort_job(job)
+            _cohort_jobs[key] = job
+            pool.submit(_run_cohort_job, job, key)
+    return jsonify({'id': job['id'], 'status': job['status'], 'status_url': f"/cohort/{job['id']}"}), 202
+
+@app.route('/cohort/<job_id>')
+def cohort_status(job_id):
+    try:
+        with open(cohort_job_path(job_id), 'r') as f:
+            return jsonify(json.load(f))
+    except (OSError, ValueError):
+        return jsonify({'error': 'Cohort job not found'}), 404
+
+@app.route('/export')
+def export():
+    export_format = request.args.get('format', 'jsonl')
+    if export_format not in FORMATS:
+        return jsonify({'error': f"Format must be one of {', '.join(FORMATS)}"}), 400
+    
+    try:
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+    except ValueError:
+        return jsonify({'error': 'since/until must be ISO dates or epoch seconds'}), 400
+    usernames = request.args.get('usernames')
+    usernames = [name for name in usernames.split(',') if name.strip()] if usernames else None
+    include_activity = request.args.get('activity', 'false').lower() in ('1', 'true', 'yes')
+    records = iter_records(store, usernames, since, until, include_activity)
+    
+    if export_format == 'jsonl':
+        return Response(stream_with_context(iter_jsonl(records)), mimetype='application/x-ndjson',
+                        headers={'Content-Disposition': 'attachment; filename=personas.jsonl'})
+    
+    # Parquet needs its footer written last, so spool to disk and stream the file
+    parquet_path = os.path.join(TEMP_DIR, f'export_{uuid.uuid4()}.parquet')
+    try:
+        write_parquet(records, parquet_path, include_activity=include_activity)
+        response = send_file(parquet_path, as_attachment=True, download_name='personas.parquet',
+                             mimetype='application/vnd.apache.parquet')
+    except Exception as e:
+        if os.path.exists(parquet_path):
+            os.remove(parquet_path)
+        return jsonify({'error': str(e)}), 500
+    response.call_on_close(lambda: os.path.exists(parquet_path) and os.remove(parquet_path))
+    return response
+
 @app.route('/download/<persona_id>/<file_type>')
 def download(persona_id, file_type):
     json_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{persona_id}.json')
@@ -165,6 +540,20 @@ def download(persona_id, file_type):
             except:
                 pass
 
+@app.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    if not _ready:
+        return jsonify({'status': 'warming up'}), 503
+    return jsonify({'status': 'ready'})
+
+@app.route('/metrics/ratelimit')
+def ratelimit_metrics():
+    return jsonify(get_scheduler().metrics())
+
 @app.route('/temp_uploads/<filename>')
 def uploaded_file(filename):
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
@@ -172,4 +561,6 @@ def uploaded_file(filename):
 atexit.register(lambda: shutil.rmtree(TEMP_DIR, ignore_errors=True))
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    warmup()
+    get_refresher()
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)), debug=True)
\ No newline at end of file
@@ -0,0 +1,10 @@
+"""WSGI entry point for pre-forking servers.
+
+Run with ``gunicorn -c gunicorn.conf.py``. Per-worker clients are created
+and warmed up by the gunicorn hooks; other WSGI servers should call
+``frontend.app.create_app()`` instead.
+"""
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from frontend.app import app
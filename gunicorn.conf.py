@@ -0,0 +1,34 @@
+import multiprocessing
+import os
+
+# Serve the Flask app from a pool of pre-forked workers
+wsgi_app = 'frontend.wsgi:app'
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+# Each thread serves one request at a time; an open /events stream holds one for its whole duration
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+# Import Flask, praw, together, PIL etc. once in the master and share the pages
+preload_app = True
+
+# Persona generation waits on Reddit and the LLM, so allow slow requests
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 180))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Give each worker its own clients, browser and temp dir."""
+    from frontend import app as frontend_app
+    frontend_app.init_worker()
+
+
+def post_worker_init(worker):
+    """Warm up and start the background refresher before the worker accepts requests."""
+    from frontend import app as frontend_app
+    frontend_app.warmup()
+    frontend_app.get_refresher()
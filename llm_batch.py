@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Batch job states after which polling stops
+TERMINAL_STATES = {'COMPLETED', 'FAILED', 'EXPIRED', 'CANCELLED'}
+
+
+class AdaptiveConcurrency:
+    """Async limit on in-flight LLM calls that adapts to the provider (AIMD).
+
+    Each success raises the limit by roughly one per round of requests, up to
+    ``max_limit``; a 429 halves it. Only requests started after the last
+    decrease can trigger another one, so a burst of 429s from the same
+    overload halves the limit once instead of collapsing it to the floor.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(self.max_limit)
+        self._active = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < int(self.limit))
+            self._active += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_throttle(self, started: float):
+        """Record a 429 for a request sent at ``started`` (``time.monotonic()``)."""
+        if started >= self._last_decrease:
+            self.limit = max(self.min_limit, self.limit / 2)
+            self._last_decrease = time.monotonic()
+
+
+def retry_delay(error: Exception, attempt: int, cap: float = 60.0) -> float:
+    """Seconds to wait before retrying: the server's Retry-After if given, else exponential.
+
+    Either way the delay is jittered so throttled requests don't all retry together.
+    """
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    try:
+        base = float(retry_after)
+    except (TypeError, ValueError):
+        base = 2 ** attempt
+    return min(cap, base) * (1 + random.random())
+
+
+def write_batch_input(path: str, model: str, requests: Dict[str, List[Dict]]):
+    """Write ``{custom_id: messages}`` as a chat-completions batch input file."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for custom_id, messages in requests.items():
+            f.write(json.dumps({'custom_id': custom_id, 'body': {'model': model, 'messages': messages}}) + '\n')
+
+
+def parse_batch_output(text: str) -> Dict[str, str]:
+    """Map each successful ``custom_id`` in a batch output file to its completion text."""
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            body = record.get('response') or {}
+            body = body.get('body', body)
+            content = body['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+            continue
+        if record.get('custom_id') is not None and content:
+            results[str(record['custom_id'])] = content
+    return results
+
+
+def run_batch_job(client, model: str, requests: Dict[str, List[Dict]],
+                  poll_interval: Optional[float] = None, timeout: Optional[float] = None) -> Dict[str, str]:
+    """Submit requests as an offline batch job and wait for it.
+
+    Returns ``{custom_id: completion text}`` for the requests that succeeded;
+    anything missing failed and is left to the caller.
+    """
+    poll_interval = poll_interval or float(os.getenv('TOGETHER_BATCH_POLL_INTERVAL', 30))
+    timeout = timeout or float(os.getenv('TOGETHER_BATCH_TIMEOUT', 24 * 3600))
+
+    fd, path = tempfile.mkstemp(suffix='.jsonl', prefix='persona_batch_')
+    os.close(fd)
+    try:
+        write_batch_input(path, model, requests)
+        uploaded = client.files.upload(file=path, purpose='batch-api', check=False)
+    finally:
+        os.remove(path)
+
+    created = client.batches.create(endpoint='/v1/chat/completions', input_file_id=uploaded.id)
+    job = created.job
+    if created.warning:
+        print(f"Batch job {job.id}: {created.warning}")
+    print(f"Submitted batch job {job.id} with {len(requests)} requests")
+    deadline = time.time() + timeout
+    while job.status not in TERMINAL_STATES:
+        if time.time() > deadline:
+            raise TimeoutError(f"Batch job {job.id} did not finish within {timeout}s")
+        time.sleep(poll_interval)
+        job = client.batches.retrieve(job.id)
+
+    if job.status != 'COMPLETED' or not job.output_file_id:
+        raise RuntimeError(f"Batch job {job.id} ended as {job.status}: {job.error}")
+    results = parse_batch_output(client.files.content(job.output_file_id).text())
+    print(f"Batch job {job.id} completed: {len(results)}/{len(requests)} succeeded")
+    return results
@@ -0,0 +1,451 @@
+"""End-to-end load test for the Flask app against local backend stand-ins.
+
+Starts a stub server that plays Reddit (OAuth API for praw, plus the HTML
+profile page used by the scraping fallback) and Together (chat completions),
+each with configurable latency and error rate. The app is launched against
+it, then /generate and /download/<id>/{json,jpg,pdf} are driven at a target
+request rate, one phase per endpoint.
+
+    python loadtest.py --rate 5 --duration 30 --output results.json
+    python loadtest.py --rate 5 --duration 30 --compare results.json
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ENDPOINTS = ('generate', 'json', 'jpg', 'pdf')
+SUBREDDITS = ['india', 'delhi', 'python', 'AskReddit', 'programming', 'personalfinance', 'movies']
+WORDS = ('i love to code in python and help people learn . my job at the company is stressful but '
+         'the career is great ? my wife and kids live in delhi and we save money').split()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def fake_text(rng: random.Random, n_words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(n_words))
+
+
+class BackendStub:
+    """Local stand-in for the Reddit API, Reddit web pages and the Together API."""
+
+    def __init__(self, reddit_latency: float, reddit_error_rate: float,
+                 llm_latency: float, llm_error_rate: float, items: int):
+        self.reddit_latency = reddit_latency
+        self.reddit_error_rate = reddit_error_rate
+        self.llm_latency = llm_latency
+        self.llm_error_rate = llm_error_rate
+        self.items = items
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def _listing(self, username: str, kind: str) -> Dict:
+        rng = random.Random(f'{username}:{kind}')
+        now = time.time()
+        children = []
+        for i in range(self.items):
+            data = {
+                'id': f'{kind}{i}{rng.randrange(10 ** 6)}',
+                'created_utc': now - rng.uniform(0, 180 * 86400),
+                'subreddit': rng.choice(SUBREDDITS),
+                'score': rng.randint(-5, 500),
+                'author': username,
+            }
+            if kind == 't3':
+                data.update(title=fake_text(rng, 8), selftext=fake_text(rng, 60),
+                            url=f'https://www.reddit.com/r/{data["subreddit"]}/comments/{data["id"]}/')
+            else:
+                data.update(body=fake_text(rng, 40), replies='', link_id='t3_x',
+                            permalink=f'/r/{data["subreddit"]}/comments/x/_/{data["id"]}/')
+            children.append({'kind': kind, 'data': data})
+        return {'kind': 'Listing', 'data': {'children': children, 'after': None, 'before': None}}
+
+    def _profile_html(self, username: str) -> str:
+        rng = random.Random(username)
+        posts = ''.join(
+            f'<div class="Post"><h3 class="_eYtD2XCVieq6emjKBH3m">{fake_text(rng, 8)}</h3>'
+            f'<div class="_292iotee39Lmt0MkQZ2hPV">{fake_text(rng, 60)}</div>'
+            f'<a class="_3ryJoIoycVkA88fy40qNJc">r/{rng.choice(SUBREDDITS)}</a>'
+            f'<a class="_3jOxDPIQ0KaOWpzvSQo-1s" href="/r/x/comments/{i}/">now</a></div>'
+            for i in range(self.items))
+        return f'<html><body>{posts}</body></html>'
+
+    def _persona(self, username: str) -> Dict:
+        return {
+            'name': username, 'age': '25-35', 'occupation': 'Tech', 'status': 'Unknown',
+            'location': 'Delhi', 'tube': 'Mainstream', 'archetype': 'The Helper',
+            'primary_traits': 'Analytical, Logical', 'secondary_traits': 'Positive, Helpful',
+            'motivations': ['Learning'], 'behavior': ['Answers questions'], 'goals': ['Career growth'],
+            'frustrations': ['Work'], 'quote': 'load test',
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body, content_type: str = 'application/json'):
+                payload = (json.dumps(body) if content_type == 'application/json' else body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+            def _fail(self, latency: float, error_rate: float) -> bool:
+                time.sleep(latency)
+                if random.random() < error_rate:
+                    self._send(503, {'error': 'injected failure'})
+                    return True
+                return False
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                body = self._read_body()
+                if path == '/api/v1/access_token':
+                    return self._send(200, {'access_token': 'loadtest', 'token_type': 'bearer',
+                                            'expires_in': 86400, 'scope': '*'})
+                if path.endswith('/chat/completions'):
+                    if self._fail(stub.llm_latency, stub.llm_error_rate):
+                        return
+                    prompt = json.loads(body or b'{}').get('messages', [{}])[-1].get('content', '')
+                    username = prompt.split('Username:', 1)[-1].split()[0] if 'Username:' in prompt else 'user'
+                    return self._send(200, {
+                        'id': 'loadtest', 'object': 'chat.completion', 'created': int(time.time()),
+                        'model': 'loadtest',
+                        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {
+                            'role': 'assistant', 'content': json.dumps(stub._persona(username))}}],
+                        'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': 200,
+                                  'total_tokens': len(prompt) // 4 + 200},
+                    })
+                self._send(404, {'error': 'not found'})
+
+            def do_GET(self):
+                parts = [p for p in urlparse(self.path).path.split('/') if p]
+                if parts == ['api', 'v1', 'me']:
+                    return self._send(200, {'name': 'loadtest', 'id': 'loadtest'})
+                if len(parts) >= 2 and parts[0] == 'user':
+                    if self._fail(stub.reddit_latency, stub.reddit_error_rate):
+                        return
+                    username = parts[1]
+                    if len(parts) == 2:
+                        return self._send(200, stub._profile_html(username), 'text/html')
+                    if parts[2] == 'submitted':
+                        return self._send(200, stub._listing(username, 't3'))
+                    if parts[2] == 'comments':
+                        return self._send(200, stub._listing(username, 't1'))
+                    if parts[2] == 'about':
+                        return self._send(200, {'kind': 't2', 'data': {
+                            'name': username, 'id': 'loadtest', 'icon_img': f'{stub.url}/avatar.png'}})
+                self._send(404, {'error': 'not found'})
+
+        return Handler
+
+
+class RssSampler:
+    """Samples the resident set size of a process tree (Linux /proc)."""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _tree(self, pid: int) -> List[int]:
+        pids = [pid]
+        try:
+            for tid in os.listdir(f'/proc/{pid}/task'):
+                with open(f'/proc/{pid}/task/{tid}/children') as f:
+                    for child in f.read().split():
+                        pids.extend(self._tree(int(child)))
+        except OSError:
+            pass
+        return pids
+
+    def rss(self) -> int:
+        if self.pid is None:
+            return 0
+        total = 0
+        for pid in self._tree(self.pid):
+            try:
+                with open(f'/proc/{pid}/statm') as f:
+                    total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            except (OSError, ValueError, IndexError):
+                pass
+        return total
+
+    def reset(self):
+        self.peak = self.rss()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.rss())
+            time.sleep(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def start_app(server: str, stub: BackendStub, workdir: str, port: int, rate_limit_qpm: int) -> subprocess.Popen:
+    # praw only takes endpoint overrides from a praw.ini in the working directory. A password
+    # grant makes it non read-only, so the API path (not the HTML fallback) is exercised.
+    with open(os.path.join(workdir, 'praw.ini'), 'w') as f:
+        f.write(f'[DEFAULT]\noauth_url={stub.url}\nreddit_url={stub.url}\n'
+                'username=loadtest\npassword=loadtest\n')
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'PYTHONPATH': ROOT + os.pathsep + env.get('PYTHONPATH', ''),
+        'REDDIT_CLIENT_ID': 'loadtest',
+        'REDDIT_CLIENT_SECRET': 'loadtest',
+        'PRAW_ALLOW_ENDPOINT_OVERRIDE': '1',
+        'REDDIT_WEB_URL': stub.url,
+        'TOGETHER_API_KEY': 'loadtest',
+        'TOGETHER_BASE_URL': f'{stub.url}/v1',
+        'REDDIT_RATE_LIMIT_QPM': str(rate_limit_qpm),
+        'REDDIT_RATE_LIMIT_DB': os.path.join(workdir, 'rate_limit.sqlite3'),
+    })
+    if server == 'gunicorn':
+        cmd = ['gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py')]
+    else:
+        cmd = [sys.executable, os.path.join(ROOT, 'frontend', 'app.py')]
+    # Run from a scratch dir so temp_uploads/ doesn't touch the checkout
+    return subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'App exited with code {proc.returncode} during startup')
+        for path in ('/readyz', '/'):
+            try:
+                if requests.get(base_url + path, timeout=2).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+        time.sleep(0.5)
+    raise RuntimeError(f'App not ready after {timeout}s')
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def run_phase(name: str, make_request, rate: float, duration: float, max_in_flight: int,
+              sampler: RssSampler) -> Dict:
+    """Fire requests open-loop at ``rate``/s for ``duration`` seconds and summarize them.
+
+    Latency is measured from each request's scheduled send time, not from when
+    a thread got to it, so time spent queued behind ``max_in_flight`` counts
+    (no coordinated omission).
+    """
+    results = []
+    lock = threading.Lock()
+
+    def fire(i):
+        intended = started + i / rate
+        try:
+            ok = make_request(i)
+        except Exception:
+            ok = False
+        with lock:
+            results.append((time.perf_counter() - intended, ok))
+
+    sampler.reset()
+    total = max(1, int(rate * duration))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for i in range(total):
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(fire, i)
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, _ in results]
+    errors = sum(1 for _, ok in results if not ok)
+    summary = {
+        'requests': len(results),
+        'throughput_rps': round(len(results) / elapsed, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'error_rate': round(errors / len(results), 4) if results else 0.0,
+        'peak_rss_mb': round(sampler.peak / 2 ** 20, 1),
+    }
+    print(f"{name:>8}: {summary['requests']} req, {summary['throughput_rps']} req/s, "
+          f"p50 {summary['p50_ms']}ms p95 {summary['p95_ms']}ms p99 {summary['p99_ms']}ms, "
+          f"errors {summary['error_rate']:.1%}, peak RSS {summary['peak_rss_mb']} MB")
+    return summary
+
+
+def compare(current: Dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline.get('started_at', '?')}):")
+    for endpoint, now in current['results'].items():
+        before = baseline.get('results', {}).get(endpoint)
+        if not before:
+            continue
+        deltas = []
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate', 'peak_rss_mb'):
+            old, new = before.get(metric, 0), now.get(metric, 0)
+            change = f'{(new - old) / old:+.0%}' if old else 'n/a'
+            deltas.append(f'{metric} {old} -> {new} ({change})')
+        print(f'{endpoint:>8}: ' + ', '.join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the persona web app against local stand-ins.')
+    parser.add_argument('--server', choices=['gunicorn', 'dev'], default='gunicorn', help='How to start the app')
+    parser.add_argument('--url', type=str, default=None, help='Test an already running app instead of starting one')
+    parser.add_argument('--rate', type=float, default=2.0, help='Target requests per second per endpoint')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds per endpoint phase')
+    parser.add_argument('--endpoints', type=str, default=','.join(ENDPOINTS),
+                        help=f"Comma-separated subset of {', '.join(ENDPOINTS)}")
+    parser.add_argument('--user-pool', type=int, default=0,
+                        help='Cycle /generate over this many usernames (0 = a new user per request)')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='Cap on concurrent client requests')
+    parser.add_argument('--items', type=int, default=100, help='Posts and comments per stub user')
+    parser.add_argument('--reddit-latency-ms', type=float, default=100.0)
+    parser.add_argument('--reddit-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-latency-ms', type=float, default=2000.0)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-qpm', type=int, default=10 ** 6,
+                        help="Reddit quota given to the app's scheduler (default: effectively unlimited)")
+    parser.add_argument('--output', type=str, default=None, help='Save results as JSON')
+    parser.add_argument('--compare', type=str, default=None, help='Baseline results JSON to compare against')
+    args = parser.parse_args()
+
+    endpoints = [e for e in args.endpoints.split(',') if e]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    stub = BackendStub(args.reddit_latency_ms / 1000, args.reddit_error_rate,
+                       args.llm_latency_ms / 1000, args.llm_error_rate, args.items)
+    stub.start()
+    workdir = tempfile.mkdtemp(prefix='persona-loadtest-')
+    proc = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+        # Not our process: RSS isn't measured
+        sampler = RssSampler(None)
+    else:
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        proc = start_app(args.server, stub, workdir, port, args.rate_limit_qpm)
+        sampler = RssSampler(proc.pid)
+    run_id = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+
+    try:
+        if proc is not None:
+            print(f'Starting app ({args.server}) against stand-ins at {stub.url}...')
+            wait_ready(base_url, proc)
+        sampler.start()
+
+        session = requests.Session()
+        session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=args.max_in_flight))
+        persona_ids = []
+        ids_lock = threading.Lock()
+
+        def generate(i):
+            n = i % args.user_pool if args.user_pool else i
+            response = session.post(f'{base_url}/generate', data={'username': f'loadtest_{run_id}_{n}'},
+                                    timeout=600)
+            if response.status_code != 200:
+                return False
+            with ids_lock:
+                persona_ids.append(response.json()['id'])
+            return True
+
+        def download(file_type):
+            def request_one(i):
+                with ids_lock:
+                    persona_id = persona_ids[i % len(persona_ids)]
+                response = session.get(f'{base_url}/download/{persona_id}/{file_type}', timeout=600)
+                return response.status_code == 200 and len(response.content) > 0
+            return request_one
+
+        results = {}
+        for endpoint in endpoints:
+            if endpoint == 'generate':
+                results[endpoint] = run_phase(endpoint, generate, args.rate, args.duration,
+                                              args.max_in_flight, sampler)
+                continue
+            if not persona_ids:
+                # Downloads need personas to exist
+                print(f'Seeding a persona for the {endpoint} phase...')
+                generate(0)
+            if not persona_ids:
+                print(f'Skipping {endpoint}: could not generate a persona')
+                continue
+            results[endpoint] = run_phase(endpoint, download(endpoint), args.rate, args.duration,
+                                          args.max_in_flight, sampler)
+    finally:
+        sampler.stop()
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        stub.stop()
+
+    report = {
+        'started_at': run_id,
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Saved results to {args.output}')
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,41 +1,163 @@
 import argparse
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from reddit_scraper import RedditScraper
 from persona_template import PersonaGenerator
+from cohort import CohortBuilder, WINDOWS
+from persona_export import FORMATS, iter_records, parse_time, write_jsonl, write_parquet
+from persona_store import PersonaStore
+from single_flight import normalize_username
 from datetime import datetime
 import os
 
+def generate_report(username, scraper, generator):
+    """Scrape a user and return their persona text, or None if no data was found."""
+    print(f"Scraping Reddit data for {username}...")
+    frame = scraper.get_user_frame(username)
+
+    if not len(frame):
+        return None
+
+    print(f"Analyzing data and generating persona for {username}...")
+    return generator.generate_persona(username, frame)
+
+def output_path_for(output, username, batch):
+    """Return the report path for a user; batch runs get one file per user."""
+    if not batch:
+        return output
+    root, ext = os.path.splitext(output)
+    return f"{root}_{username}{ext or '.txt'}"
+
+def save_report(path, username, persona):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"Reddit User Persona Report\n")
+        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"Source: https://www.reddit.com/user/{username}/\n\n")
+        f.write(persona)
+
+def cohort_main(argv):
+    """`python main.py cohort <subreddit>`: personas for a subreddit's top contributors."""
+    parser = argparse.ArgumentParser(prog='main.py cohort',
+                                     description="Generate personas for a subreddit's top contributors.")
+    parser.add_argument('subreddit', type=str, help='Subreddit to analyze (without r/)')
+    parser.add_argument('--top', type=int, default=25, help='Number of top contributors to profile')
+    parser.add_argument('--window', type=str, default='week', choices=list(WINDOWS), help='Activity window')
+    parser.add_argument('--post-limit', type=int, default=100, help='Submissions read per listing')
+    parser.add_argument('--no-history', action='store_true',
+                        help="Only use activity found in the subreddit, don't fetch each user's history")
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent fetches')
+    parser.add_argument('--batch-job', action='store_true',
+                        help='Generate personas through an offline Together batch job (slower, cheaper)')
+    parser.add_argument('--output', type=str, default=None, help='Output JSON path (default: cohort_<subreddit>.json)')
+    args = parser.parse_args(argv)
+    if args.top <= 0:
+        parser.error('--top must be a positive integer')
+
+    subreddit = args.subreddit.strip('/').split('/')[-1]
+    print(f"Building cohort for r/{subreddit}")
+    builder = CohortBuilder(max_workers=args.workers)
+    cohort = builder.build(subreddit, top_n=args.top, window=args.window,
+                           post_limit=args.post_limit, fetch_history=not args.no_history,
+                           batch_job=args.batch_job)
+
+    output = args.output or f"cohort_{subreddit}.json"
+    print(f"Saving {len(cohort['members'])} personas to {output}")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(cohort, f, indent=2)
+
+def export_main(argv):
+    """`python main.py export`: bulk export of stored personas."""
+    parser = argparse.ArgumentParser(prog='main.py export', description='Export stored personas.')
+    parser.add_argument('--format', type=str, default='jsonl', choices=FORMATS, help='Output format')
+    parser.add_argument('--output', type=str, default=None, help='Output path (default: personas.<format>)')
+    parser.add_argument('--usernames', type=str, nargs='*', default=None, help='Only export these users')
+    parser.add_argument('--since', type=str, default=None, help='Generated at or after (ISO date or epoch)')
+    parser.add_argument('--until', type=str, default=None, help='Generated before (ISO date or epoch)')
+    parser.add_argument('--activity', action='store_true', help='Include the underlying posts and comments')
+    parser.add_argument('--store', type=str, default='temp_uploads', help='Persona store folder')
+    args = parser.parse_args(argv)
+
+    records = iter_records(PersonaStore(args.store), args.usernames, parse_time(args.since),
+                           parse_time(args.until), args.activity)
+    output = args.output or f"personas.{args.format}"
+    if args.format == 'parquet':
+        count = write_parquet(records, output, include_activity=args.activity)
+    else:
+        count = write_jsonl(records, output)
+    print(f"Exported {count} personas to {output}")
+
 def main():
+    if sys.argv[1:2] == ['cohort']:
+        return cohort_main(sys.argv[2:])
+    if sys.argv[1:2] == ['export']:
+        return export_main(sys.argv[2:])
+
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Generate a user persona from Reddit profile.')
-    parser.add_argument('username', type=str, help='Reddit username to analyze')
-    parser.add_argument('--output', type=str, default='persona_output.txt', help='Output file path')
+    parser.add_argument('usernames', type=str, nargs='+', metavar='username', help='Reddit username(s) to analyze')
+    parser.add_argument('--output', type=str, default='persona_output.txt',
+                        help='Output file path (with several users, one file per user is written next to it)')
+    parser.add_argument('--workers', type=int, default=4, help='Users scraped concurrently in batch mode')
+    parser.add_argument('--llm-concurrency', type=int, default=None,
+                        help='Maximum concurrent LLM requests in batch mode (default: TOGETHER_MAX_CONCURRENCY or 16)')
+    parser.add_argument('--batch-job', action='store_true',
+                        help='Generate personas through an offline Together batch job (slower, cheaper)')
     args = parser.parse_args()
-    
-    print(f"Generating persona for user: {args.username}")
-    
-    # Step 1: Scrape Reddit data
-    print("Scraping Reddit data...")
-    scraper = RedditScraper()
-    posts, comments = scraper.get_user_data(args.username)
-    
-    if not posts and not comments:
-        print("Error: No data found for this user.")
-        return
-    
-    # Step 2: Generate persona
-    print("Analyzing data and generating persona...")
+
+    batch = len(args.usernames) > 1
     generator = PersonaGenerator()
-    persona = generator.generate_persona(args.username, posts, comments)
-    
-    # Step 3: Save output
-    print(f"Saving persona to {args.output}")
-    with open(args.output, 'w', encoding='utf-8') as f:
-        f.write(f"Reddit User Persona Report\n")
-        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Source: https://www.reddit.com/user/{args.username}/\n\n")
-        f.write(persona)
-    
-    print("Persona generation complete!")
+
+    if not batch:
+        username = args.usernames[0]
+        print(f"Generating persona for user: {username}")
+        persona = generate_report(username, RedditScraper(priority='interactive'), generator)
+        if persona is None:
+            print(f"Error: No data found for user {username}.")
+            return
+        print(f"Saving persona to {args.output}")
+        save_report(args.output, username, persona)
+        print("Persona generation complete!")
+        return
+
+    # Repeated spellings of the same user are scraped and analyzed once
+    users = {}
+    for username in args.usernames:
+        users.setdefault(normalize_username(username), username)
+
+    # praw.Reddit instances aren't thread-safe, so each fetch thread gets its own.
+    # Batch runs yield Reddit quota to interactive web requests.
+    local = threading.local()
+
+    def fetch(username):
+        scraper = getattr(local, 'scraper', None)
+        if scraper is None:
+            scraper = local.scraper = RedditScraper(priority='bulk')
+        print(f"Scraping Reddit data for {username}...")
+        return username, scraper.get_user_frame(username)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        fetched = list(executor.map(fetch, users.values()))
+
+    found = []
+    for username, frame in fetched:
+        if len(frame):
+            found.append((username, frame))
+        else:
+            print(f"Error: No data found for user {username}.")
+
+    # Everyone's analysis goes out in one concurrent LLM pass
+    print(f"Analyzing data and generating personas for {len(found)} users...")
+    personas = generator.generate_personas_batch(found, max_concurrency=args.llm_concurrency,
+                                                 use_batch_job=args.batch_job)
+    for (username, _), persona in zip(found, personas):
+        path = output_path_for(args.output, username, batch)
+        print(f"Saving persona to {path}")
+        save_report(path, username, generator._format_persona(persona))
+
+    if len(found) == len(fetched):
+        print("Persona generation complete!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,139 @@
+import json
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from persona_store import PersonaStore
+from single_flight import normalize_username
+
+FORMATS = ('jsonl', 'parquet')
+
+# Persona fields that get their own Parquet column; anything else goes in extra_json
+STRING_FIELDS = ('name', 'age', 'occupation', 'status', 'location', 'tube', 'archetype',
+                 'primary_traits', 'secondary_traits', 'quote', 'photo')
+LIST_FIELDS = ('motivations', 'behavior', 'goals', 'frustrations')
+ACTIVITY_FIELDS = ('id', 'type', 'subreddit', 'title', 'text', 'url')
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Parse an epoch timestamp or ISO date/datetime (UTC if no zone is given)."""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def iter_records(store: PersonaStore, usernames: Optional[Iterable[str]] = None,
+                 since: Optional[float] = None, until: Optional[float] = None,
+                 include_activity: bool = False) -> Iterator[Dict]:
+    """Stream stored personas one record at a time, so memory doesn't grow with the dataset."""
+    if usernames is not None:
+        usernames = [normalize_username(name) for name in usernames]
+    for row in store.iter_rows(usernames, since, until):
+        persona = store.load(row['persona_id'])
+        if persona is None:
+            continue
+        record = {
+            'username': row['display_username'] or row['username'],
+            'persona_id': row['persona_id'],
+            'generated_at': datetime.fromtimestamp(row['generated_at'], timezone.utc).isoformat(),
+            'persona': persona,
+        }
+        if include_activity:
+            record['activity'] = list(store.iter_activity(row['persona_id']))
+        yield record
+
+
+def iter_jsonl(records: Iterable[Dict], chunk_size: int = 100) -> Iterator[str]:
+    """Yield JSON Lines in chunks of ``chunk_size`` records."""
+    chunk = []
+    for record in records:
+        chunk.append(json.dumps(record) + '\n')
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def write_jsonl(records: Iterable[Dict], path: str, chunk_size: int = 100) -> int:
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for chunk in iter_jsonl(records, chunk_size):
+            f.write(chunk)
+            count += chunk.count('\n')
+    return count
+
+
+def _parquet_schema(pa, include_activity: bool):
+    fields = [
+        pa.field('username', pa.string()),
+        pa.field('persona_id', pa.string()),
+        pa.field('generated_at', pa.timestamp('us', tz='UTC')),
+    ]
+    fields += [pa.field(name, pa.string()) for name in STRING_FIELDS]
+    fields += [pa.field(name, pa.list_(pa.string())) for name in LIST_FIELDS]
+    fields.append(pa.field('extra_json', pa.string()))
+    if include_activity:
+        item = pa.struct([pa.field(name, pa.string()) for name in ACTIVITY_FIELDS] + [
+            pa.field('created_utc', pa.float64()),
+            pa.field('upvotes', pa.int64()),
+        ])
+        fields.append(pa.field('activity', pa.list_(item)))
+    return pa.schema(fields)
+
+
+def _parquet_row(record: Dict, include_activity: bool) -> Dict:
+    persona = record['persona']
+    row = {
+        'username': record['username'],
+        'persona_id': record['persona_id'],
+        'generated_at': datetime.fromisoformat(record['generated_at']),
+    }
+    for name in STRING_FIELDS:
+        value = persona.get(name)
+        row[name] = None if value is None else str(value)
+    for name in LIST_FIELDS:
+        value = persona.get(name)
+        row[name] = [str(v) for v in value] if isinstance(value, list) else None
+    extra = {k: v for k, v in persona.items() if k not in STRING_FIELDS and k not in LIST_FIELDS}
+    row['extra_json'] = json.dumps(extra)
+    if include_activity:
+        row['activity'] = [
+            dict({name: item.get(name) for name in ACTIVITY_FIELDS},
+                 created_utc=item.get('created_utc'), upvotes=item.get('upvotes'))
+            for item in record.get('activity', [])
+        ]
+    return row
+
+
+def write_parquet(records: Iterable[Dict], path: str, include_activity: bool = False,
+                  chunk_size: Optional[int] = None) -> int:
+    """Write records as Parquet, one row group per ``chunk_size`` personas."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    # Rows carrying activity are much bigger, so flush them more often
+    chunk_size = chunk_size or (100 if include_activity else 1000)
+    schema = _parquet_schema(pa, include_activity)
+    count = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        chunk: List[Dict] = []
+        for record in records:
+            chunk.append(_parquet_row(record, include_activity))
+            if len(chunk) >= chunk_size:
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            count += len(chunk)
+    return count
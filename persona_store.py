@@ -0,0 +1,307 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from activity_frame import ActivityFrame
+
+load_dotenv()
+
+
+class PersonaStore:
+    """Stored personas, one per (normalized) username.
+
+    Persona JSON lives in ``<folder>/<persona_id>.json`` as before, so download
+    links keep working; a SQLite index maps usernames to their latest persona
+    along with when it was generated and how often it is requested.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.path = os.path.join(folder, 'personas.sqlite3')
+        self._local = threading.local()
+        os.makedirs(folder, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS personas ('
+            'username TEXT PRIMARY KEY, display_username TEXT, persona_id TEXT, '
+            'generated_at REAL, hits INTEGER DEFAULT 0, last_requested REAL, refresh_lease REAL DEFAULT 0)')
+        conn.execute('CREATE INDEX IF NOT EXISTS personas_hits ON personas (hits DESC)')
+        conn.execute('CREATE TABLE IF NOT EXISTS builds (username TEXT PRIMARY KEY, lease REAL)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def json_path(self, persona_id: str) -> str:
+        return os.path.join(self.folder, f'{persona_id}.json')
+
+    def activity_path(self, persona_id: str) -> str:
+        return os.path.join(self.folder, f'{persona_id}.activity.jsonl')
+
+    def lookup(self, username: str, count_hit: bool = True) -> Optional[sqlite3.Row]:
+        """Return the index row for a username, recording the request."""
+        conn = self._connect()
+        if count_hit:
+            conn.execute('UPDATE personas SET hits = hits + 1, last_requested = ? WHERE username = ?',
+                         (time.time(), username))
+        return conn.execute('SELECT * FROM personas WHERE username = ?', (username,)).fetchone()
+
+    def load(self, persona_id: str) -> Optional[Dict]:
+        try:
+            with open(self.json_path(persona_id), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Couldn't load persona {persona_id}: {e}")
+            return None
+
+    def save(self, username: str, persona_data: Dict, display_username: Optional[str] = None,
+             activity: Optional[ActivityFrame] = None) -> Dict:
+        """Store a persona for a username, reusing its existing id so links stay valid.
+
+        ``activity`` is the frame it was built from, kept for exports.
+        """
+        row = self.lookup(username, count_hit=False)
+        persona_data['id'] = row['persona_id'] if row else str(uuid.uuid4())
+
+        if activity is not None:
+            tmp_path = self.activity_path(persona_data['id']) + '.tmp'
+            with open(tmp_path, 'w') as f:
+                for i in range(len(activity)):
+                    f.write(json.dumps(activity.item(i)) + '\n')
+            os.replace(tmp_path, self.activity_path(persona_data['id']))
+
+        # Write then rename so readers never see a half-written file
+        tmp_path = self.json_path(persona_data['id']) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(persona_data, f)
+        os.replace(tmp_path, self.json_path(persona_data['id']))
+
+        self._connect().execute(
+            'INSERT INTO personas (username, display_username, persona_id, generated_at, hits, last_requested) '
+            'VALUES (?, ?, ?, ?, 0, ?) ON CONFLICT(username) DO UPDATE SET '
+            'display_username = COALESCE(?, display_username), generated_at = excluded.generated_at, '
+            'refresh_lease = 0',
+            (username, display_username or username, persona_data['id'], time.time(), time.time(),
+             display_username))
+        return persona_data
+
+    def iter_activity(self, persona_id: str) -> Iterator[Dict]:
+        """Stream the stored activity items for a persona, one at a time."""
+        try:
+            with open(self.activity_path(persona_id), 'r') as f:
+                for line in f:
+                    yield json.loads(line)
+        except FileNotFoundError:
+            return
+
+    def iter_rows(self, usernames: Optional[Iterable[str]] = None, since: Optional[float] = None,
+                  until: Optional[float] = None, batch_size: int = 500) -> Iterator[sqlite3.Row]:
+        """Stream index rows, optionally filtered by username and generation time."""
+        conditions, params = [], []
+        if since is not None:
+            conditions.append('generated_at >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('generated_at < ?')
+            params.append(until)
+
+        if usernames is None:
+            batches = [None]
+        else:
+            names = sorted(set(usernames))
+            batches = [names[i:i + batch_size] for i in range(0, len(names), batch_size)]
+
+        for batch in batches:
+            where = list(conditions)
+            batch_params = list(params)
+            if batch is not None:
+                where.append(f"username IN ({', '.join('?' * len(batch))})")
+                batch_params.extend(batch)
+            sql = 'SELECT * FROM personas'
+            if where:
+                sql += ' WHERE ' + ' AND '.join(where)
+            cursor = self._connect().execute(sql + ' ORDER BY generated_at', batch_params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+    def claim_build(self, username: str, lease_seconds: float) -> Optional[float]:
+        """Claim the right to build a persona, so only one worker process scrapes a user at once.
+
+        Returns the lease to pass to ``release_build``, or None if another
+        process holds an unexpired lease.
+        """
+        now = time.time()
+        lease = now + lease_seconds
+        cursor = self._connect().execute(
+            'INSERT INTO builds (username, lease) VALUES (?, ?) '
+            'ON CONFLICT(username) DO UPDATE SET lease = excluded.lease WHERE builds.lease < ?',
+            (username, lease, now))
+        return lease if cursor.rowcount == 1 else None
+
+    def release_build(self, username: str, lease: float):
+        """Release a lease from ``claim_build``; a lease since taken over by another process is left alone."""
+        self._connect().execute('DELETE FROM builds WHERE username = ? AND lease = ?', (username, lease))
+
+    def wait_for_build(self, username: str, since: float, timeout: float,
+                       poll_interval: float = 0.25) -> Optional[sqlite3.Row]:
+        """Wait for another process's build of a user.
+
+        Returns the index row once a persona saved after ``since`` appears, or
+        None if the build ends without one (no data, failure, expired lease).
+        """
+        deadline = time.time() + timeout
+        while True:
+            row = self.lookup(username, count_hit=False)
+            if row is not None and row['generated_at'] >= since:
+                return row
+            lease = self._connect().execute('SELECT lease FROM builds WHERE username = ?', (username,)).fetchone()
+            if lease is None or lease['lease'] < time.time() or time.time() > deadline:
+                # Saves happen before the lease is released, so check once more
+                row = self.lookup(username, count_hit=False)
+                return row if row is not None and row['generated_at'] >= since else None
+            time.sleep(poll_interval)
+
+    def claim_refresh(self, username: str, lease_seconds: float) -> bool:
+        """Atomically claim the right to regenerate a persona (one process at a time)."""
+        now = time.time()
+        cursor = self._connect().execute(
+            'UPDATE personas SET refresh_lease = ? WHERE username = ? AND refresh_lease < ?',
+            (now + lease_seconds, username, now))
+        return cursor.rowcount == 1
+
+    def release_refresh(self, username: str):
+        self._connect().execute('UPDATE personas SET refresh_lease = 0 WHERE username = ?', (username,))
+
+    def refresh_candidates(self, generated_before: float, requested_after: float, limit: int) -> List[sqlite3.Row]:
+        """Most-requested personas generated before a cutoff and still being requested."""
+        return self._connect().execute(
+            'SELECT * FROM personas WHERE generated_at < ? AND last_requested >= ? AND refresh_lease < ? '
+            'ORDER BY hits DESC LIMIT ?',
+            (generated_before, requested_after, time.time(), limit)).fetchall()
+
+
+class FreshnessPolicy:
+    """Soft/hard TTLs for serving stored personas.
+
+    Younger than ``soft_ttl``: served as is. Between the two: served and
+    regenerated in the background. Older than ``hard_ttl``: regenerated
+    before responding.
+    """
+
+    FRESH = 'fresh'
+    STALE = 'stale'
+    EXPIRED = 'expired'
+
+    def __init__(self, soft_ttl: Optional[float] = None, hard_ttl: Optional[float] = None):
+        self.soft_ttl = soft_ttl if soft_ttl is not None else float(os.getenv('PERSONA_SOFT_TTL', 6 * 3600))
+        self.hard_ttl = hard_ttl if hard_ttl is not None else float(os.getenv('PERSONA_HARD_TTL', 7 * 86400))
+
+    def state(self, generated_at: float) -> str:
+        age = time.time() - generated_at
+        if age < self.soft_ttl:
+            return self.FRESH
+        if age < self.hard_ttl:
+            return self.STALE
+        return self.EXPIRED
+
+    def describe(self, generated_at: float, state: str, refreshing: bool = False) -> Dict:
+        """Freshness block returned alongside a persona."""
+        return {
+            'state': state,
+            'generated_at': datetime.fromtimestamp(generated_at, timezone.utc).isoformat(),
+            'age_seconds': int(time.time() - generated_at),
+            'refreshing': refreshing,
+        }
+
+
+class BackgroundRefresher:
+    """Regenerates personas off the request path.
+
+    Stale personas are queued by ``enqueue``; in addition, every ``interval``
+    seconds the most-requested personas close to their soft TTL are rebuilt
+    before they expire. A lease in the store keeps several worker processes
+    from regenerating the same user at once.
+    """
+
+    def __init__(self, store: PersonaStore, policy: FreshnessPolicy, rebuild: Callable[[str], object],
+                 interval: Optional[float] = None, batch_size: Optional[int] = None, lease_seconds: float = 600):
+        self.store = store
+        self.policy = policy
+        self.rebuild = rebuild
+        self.interval = interval or float(os.getenv('PERSONA_REFRESH_INTERVAL', 300))
+        self.batch_size = batch_size or int(os.getenv('PERSONA_REFRESH_BATCH', 20))
+        self.lease_seconds = lease_seconds
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='persona-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._queue.put(None)
+
+    def enqueue(self, username: str) -> bool:
+        """Queue a regeneration; False if another process or thread already has it."""
+        if not self.store.claim_refresh(username, self.lease_seconds):
+            return False
+        self._queue.put(username)
+        return True
+
+    def _run(self):
+        next_scan = time.time() + self.interval
+        while not self._stop.is_set():
+            try:
+                username = self._queue.get(timeout=max(0.0, next_scan - time.time()))
+                if username is not None:
+                    self._refresh(username)
+            except queue.Empty:
+                self._scan()
+                next_scan = time.time() + self.interval
+
+    def _scan(self):
+        """Proactively rebuild popular personas that will go stale before the next scan."""
+        now = time.time()
+        try:
+            candidates = self.store.refresh_candidates(
+                generated_before=now - self.policy.soft_ttl + self.interval,
+                requested_after=now - self.policy.hard_ttl,
+                limit=self.batch_size)
+        except sqlite3.Error as e:
+            print(f"Persona refresh scan failed: {e}")
+            return
+        for row in candidates:
+            if self._stop.is_set():
+                break
+            if self.store.claim_refresh(row['username'], self.lease_seconds):
+                self._refresh(row['username'])
+
+    def _refresh(self, username: str):
+        row = self.store.lookup(username, count_hit=False)
+        try:
+            self.rebuild(row['display_username'] if row else username)
+        except Exception as e:
+            print(f"Background refresh failed for {username}: {e}")
+        finally:
+            self.store.release_refresh(username)
@@ -1,20 +1,74 @@
 
+import asyncio
 import base64
-from datetime import datetime
-from typing import List, Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
 import os
 from dotenv import load_dotenv
 import json
 import re
-from together import Together
+from collections import Counter
+import time
+import numpy as np
+from together import APIConnectionError, AsyncTogether, InternalServerError, RateLimitError
+from activity_frame import ActivityFrame, POST, COMMENT
+from timeline import build_timeline
+from llm_batch import AdaptiveConcurrency, retry_delay, run_batch_job
+from subreddit_taxonomy import get_taxonomy
+from together_client import create_async_together_client, get_async_together_client, get_together_client
 
 load_dotenv()
 
+# Fields every persona carries, whichever tier produced it
+PERSONA_TEXT_FIELDS = ('name', 'age', 'occupation', 'status', 'location', 'tube', 'archetype',
+                       'primary_traits', 'secondary_traits', 'quote')
+PERSONA_LIST_FIELDS = ('motivations', 'behavior', 'goals', 'frustrations')
+
+# Taxonomy categories (data/subreddit_taxonomy.csv) that signal each motivation / goal
+CATEGORY_MOTIVATIONS = {
+    'education': 'Learning', 'science': 'Learning', 'technology': 'Learning', 'news': 'Learning',
+    'politics': 'Learning', 'advice': 'Helping', 'support': 'Helping', 'discussion': 'Sharing',
+    'stories': 'Sharing', 'relationships': 'Sharing', 'creative': 'Sharing', 'gaming': 'Entertainment',
+    'entertainment': 'Entertainment', 'humor': 'Entertainment', 'music': 'Entertainment',
+    'movies': 'Entertainment', 'sports': 'Entertainment',
+}
+CATEGORY_GOALS = {
+    'career': 'Career growth', 'business': 'Career growth', 'education': 'Education', 'science': 'Education',
+    'relationships': 'Relationships', 'finance': 'Financial',
+}
+
+# A subreddit label only counts once it covers this much of the user's activity
+MIN_SUBREDDIT_ITEMS = 2
+MIN_SUBREDDIT_SHARE = 0.1
+
+# Kept byte-identical across requests so the provider can reuse the cached prefix
+PERSONA_SYSTEM_PROMPT = """Analyze the Reddit user's activity in the next message and create a detailed persona in JSON format.
+
+Required JSON format:
+{
+    "name": "string",
+    "age": "string",
+    "occupation": "string",
+    "status": "string",
+    "location": "string",
+    "tube": "string",
+    "archetype": "string",
+    "primary_traits": "string",
+    "secondary_traits": "string",
+    "motivations": ["string"],
+    "behavior": ["string"],
+    "goals": ["string"],
+    "frustrations": ["string"],
+    "quote": "string"
+}"""
+
 class PersonaGenerator:
     def __init__(self):
         """Initialize with Together API."""
-        self.client = Together(api_key=os.getenv("TOGETHER_API_KEY"))
+        # Shared by every generator in the process, so connections are kept alive across requests
+        self.client = get_together_client()
         self.model = "deepseek-ai/DeepSeek-V3"
+        self._upgrades = None
         self.template = """
 # {name}
 
@@ -55,55 +109,74 @@ class PersonaGenerator:
 "{quote}"
 """
 
-    def generate_persona(self, username: str, posts: List[Dict], comments: List[Dict]) -> str:
+    def generate_persona(self, username: str, frame: ActivityFrame) -> str:
         """Generate persona using either API or heuristic analysis."""
-        if not posts and not comments:
+        if not len(frame):
             return self._create_empty_persona(username)
         
-        combined_text = self._combine_text_data(posts, comments)
+        combined_text = self._combine_text_data(frame)
         
         try:
             analysis = self._analyze_with_together_api(username, combined_text)
             return self._format_persona(analysis)
         except Exception as e:
             print(f"Together API failed, using heuristic analysis: {e}")
-            return self._heuristic_analysis(username, posts, comments)
+            return self._heuristic_analysis(username, frame)
+
+    async def agenerate_persona(self, username: str, frame: ActivityFrame,
+                                client: Optional[AsyncTogether] = None) -> str:
+        """Async version of ``generate_persona``.
+
+        ``client`` defaults to the running loop's shared client, which is only
+        meant for long-lived loops; see ``agenerate_persona_json``.
+        """
+        if not len(frame):
+            return self._create_empty_persona(username)
+        
+        combined_text = self._combine_text_data(frame)
+        
+        try:
+            analysis = await self._aanalyze_with_together_api(username, combined_text, client)
+            return self._format_persona(analysis)
+        except Exception as e:
+            print(f"Together API failed, using heuristic analysis: {e}")
+            return self._heuristic_analysis(username, frame)
+
+    async def agenerate_persona_json(self, username: str, frame: ActivityFrame,
+                                     client: Optional[AsyncTogether] = None) -> Dict:
+        """Async version of ``generate_persona_json``; no thread is held while the LLM runs.
+
+        ``client`` defaults to the running loop's shared client, which lives as
+        long as the loop. That suits a long-lived server loop; code that starts
+        a loop per call (``asyncio.run``) should pass a client it closes, e.g.
+        from ``create_async_together_client()``, or await
+        ``aclose_async_together_client()`` before its loop ends.
+        """
+        if not len(frame):
+            return self._create_empty_persona_json(username)
+        
+        combined_text = self._combine_text_data(frame)
+        
+        try:
+            analysis = await self._aanalyze_with_together_api(username, combined_text, client)
+            return self._llm_persona_json(username, analysis, frame)
+        except Exception as e:
+            print(f"Together API failed, using heuristic analysis: {e}")
+            return self._heuristic_analysis_json(username, frame)
+
+    def _persona_messages(self, username: str, text_data: str) -> List[Dict]:
+        """Chat messages for one user; the system prompt is identical across users."""
+        return [
+            {"role": "system", "content": PERSONA_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Username: {username}\nActivity Data:\n{text_data[:10000]}"},
+        ]
 
     def _analyze_with_together_api(self, username: str, text_data: str) -> Dict:
         """Use Together API to analyze user data."""
-        prompt = f"""Analyze this Reddit user's activity and create a detailed persona in JSON format:
-        
-        Username: {username}
-        Activity Data:
-        {text_data[:10000]}  # Limit to avoid hitting token limits
-        
-        Required JSON format:
-        {{
-            "name": "string",
-            "age": "string",
-            "occupation": "string",
-            "status": "string",
-            "location": "string",
-            "tube": "string",
-            "archetype": "string",
-            "primary_traits": "string",
-            "secondary_traits": "string",
-            "motivations": ["string"],
-            "behavior": ["string"],
-            "goals": ["string"],
-            "frustrations": ["string"],
-            "quote": "string"
-        }}"""
-        
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
+                messages=self._persona_messages(username, text_data)
             )
             
             # Extract the generated content
@@ -117,6 +190,100 @@ class PersonaGenerator:
             print(f"Together API error: {e}")
             raise ValueError("Failed to analyze with Together API")
 
+    async def _aanalyze_with_together_api(self, username: str, text_data: str,
+                                          client: Optional[AsyncTogether] = None) -> Dict:
+        try:
+            response = await (client or get_async_together_client()).chat.completions.create(
+                model=self.model,
+                messages=self._persona_messages(username, text_data)
+            )
+            return json.loads(self._extract_json(response.choices[0].message.content))
+        except Exception as e:
+            print(f"Together API error: {e}")
+            raise ValueError("Failed to analyze with Together API")
+
+    def generate_personas_batch(self, users: Iterable[Tuple[str, ActivityFrame]],
+                                max_concurrency: Optional[int] = None,
+                                use_batch_job: bool = False) -> List[Dict]:
+        """Generate persona JSON for many ``(username, frame)`` at once.
+
+        Prompts go out concurrently through the async client, throttled by an
+        adaptive limit that backs off on 429s. With ``use_batch_job`` they are
+        first submitted as an offline Together batch job; whatever that job
+        doesn't return is retried concurrently. Users whose analysis still
+        fails get the heuristic persona. Results are in the order of ``users``.
+        """
+        users = list(users)
+        requests = {
+            i: self._persona_messages(username, self._combine_text_data(frame))
+            for i, (username, frame) in enumerate(users) if len(frame)
+        }
+
+        analyses = {}
+        if use_batch_job and requests:
+            try:
+                completed = run_batch_job(self.client, self.model,
+                                          {f"persona-{i}": messages for i, messages in requests.items()})
+                for i in requests:
+                    if f"persona-{i}" in completed:
+                        try:
+                            analyses[i] = json.loads(self._extract_json(completed[f"persona-{i}"]))
+                        except ValueError as e:
+                            print(f"Unparseable batch result for {users[i][0]}: {e}")
+            except Exception as e:
+                print(f"Batch job failed, falling back to concurrent requests: {e}")
+
+        remaining = {i: messages for i, messages in requests.items() if i not in analyses}
+        if remaining:
+            analyses.update(asyncio.run(self._analyze_concurrently(remaining, max_concurrency)))
+
+        personas = []
+        for i, (username, frame) in enumerate(users):
+            if not len(frame):
+                personas.append(self._create_empty_persona_json(username))
+            elif i in analyses:
+                personas.append(self._llm_persona_json(username, analyses[i], frame))
+            else:
+                personas.append(self._heuristic_analysis_json(username, frame))
+        print(f"Generated {len(personas)} personas, {len(analyses)} with the LLM")
+        return personas
+
+    async def _analyze_concurrently(self, requests: Dict[int, List[Dict]],
+                                    max_concurrency: Optional[int] = None) -> Dict[int, Dict]:
+        """Run many chat completions at once; returns analyses for the ones that succeeded."""
+        limiter = AdaptiveConcurrency(max_concurrency or int(os.getenv('TOGETHER_MAX_CONCURRENCY', 16)))
+        results = {}
+
+        # A client scoped to this batch: its loop ends with the batch, so its sockets must too.
+        # Retries are handled here so 429s also feed back into the concurrency limit.
+        async with create_async_together_client(max_retries=0) as client:
+            async def analyze(i, messages):
+                try:
+                    results[i] = await self._acomplete_json(client, limiter, messages)
+                except Exception as e:
+                    print(f"Together API failed for request {i}: {e}")
+            await asyncio.gather(*(analyze(i, messages) for i, messages in requests.items()))
+        return results
+
+    async def _acomplete_json(self, client: AsyncTogether, limiter: AdaptiveConcurrency,
+                              messages: List[Dict], max_attempts: int = 8) -> Dict:
+        for attempt in range(max_attempts):
+            async with limiter:
+                started = time.monotonic()
+                try:
+                    response = await client.chat.completions.create(model=self.model, messages=messages)
+                except RateLimitError as e:
+                    limiter.on_throttle(started)
+                    error = e
+                except (APIConnectionError, InternalServerError) as e:
+                    error = e
+                else:
+                    limiter.on_success()
+                    return json.loads(self._extract_json(response.choices[0].message.content))
+            if attempt + 1 < max_attempts:
+                await asyncio.sleep(retry_delay(error, attempt))
+        raise error
+
     def _extract_json(self, text: str) -> str:
         """Extract JSON content from the API response."""
         # Try to find JSON in the response
@@ -147,55 +314,52 @@ class PersonaGenerator:
             quote=analysis.get("quote", "No representative quote available")
         )
 
-    def _combine_text_data(self, posts: List[Dict], comments: List[Dict]) -> str:
+    def _combine_text_data(self, frame: ActivityFrame) -> str:
         """Combine and prioritize high-quality content."""
         text_parts = []
         
         # Add most upvoted posts first
-        for post in sorted(posts, key=lambda x: x.get('upvotes', 0), reverse=True)[:30]:
-            text_parts.append(f"POST in r/{post['subreddit']} ({post.get('upvotes', 0)} upvotes): {post['title']}\n{post['text']}")
+        for i in frame.top_k(30, POST):
+            text_parts.append(f"POST in r/{frame.subreddit(i)} ({frame.upvotes[i]} upvotes): {frame.field(i, 'title')}\n{frame.field(i, 'text')}")
         
         # Add most upvoted comments
-        for comment in sorted(comments, key=lambda x: x.get('upvotes', 0), reverse=True)[:30]:
-            text_parts.append(f"COMMENT in r/{comment['subreddit']} ({comment.get('upvotes', 0)} upvotes): {comment['text']}")
+        for i in frame.top_k(30, COMMENT):
+            text_parts.append(f"COMMENT in r/{frame.subreddit(i)} ({frame.upvotes[i]} upvotes): {frame.field(i, 'text')}")
         
         return "\n\n".join(text_parts)
 
 
-    def _heuristic_analysis(self, username: str, posts: List[Dict], comments: List[Dict]) -> str:
+    def _heuristic_analysis(self, username: str, frame: ActivityFrame) -> str:
         """Comprehensive analysis using multiple inference methods."""
         print("Performing comprehensive heuristic analysis...")
         
-        # Combine all activity items
-        all_items = posts + comments
-        
         # Basic metrics
-        subreddits = self._get_subreddit_stats(all_items)
-        total_posts = len(posts)
-        total_comments = len(comments)
+        subreddits = frame.subreddit_counts()
+        total_posts = len(frame.indices(POST))
+        total_comments = len(frame.indices(COMMENT))
         most_active_subreddits = sorted(subreddits.items(), key=lambda x: x[1], reverse=True)[:3]
         
         # Detailed inferences
-        age = self._infer_age(all_items)
-        occupation = self._infer_occupation(all_items)
-        location = self._infer_location(all_items)
-        status = self._infer_relationship_status(all_items)
-        motivations = self._infer_motivations(all_items)
-        goals = self._infer_goals(all_items)
-        frustrations = self._infer_frustrations(all_items)
-        quote = self._find_representative_quote(all_items)
+        age = self._infer_age(frame)
+        occupation = self._infer_occupation(frame, subreddits)
+        location = self._infer_location(frame, subreddits)
+        status = self._infer_relationship_status(frame)
+        motivations = self._infer_motivations(frame, subreddits)
+        goals = self._infer_goals(frame, subreddits)
+        frustrations = self._infer_frustrations(frame)
+        quote = self._find_representative_quote(frame)
         
         # Enhanced behavior analysis
         behavior = [
             f"Active in {len(subreddits)} subreddits",
             f"Has made {total_posts} posts and {total_comments} comments",
             f"Most active in: {', '.join([f'r/{s[0]} ({s[1]} activities)' for s in most_active_subreddits])}",
-            f"Most frequent posting times: {self._infer_posting_times(all_items)}",
-            f"Engagement style: {self._infer_engagement_style(all_items)}"
+            f"Most frequent posting times: {self._infer_posting_times(frame)}",
+            f"Engagement style: {self._infer_engagement_style(frame)}"
         ]
         
         # Add specific behaviors if found
-        specific_behaviors = self._find_specific_behaviors(all_items)
+        specific_behaviors = self._find_specific_behaviors(frame)
         behavior.extend(specific_behaviors)
         
         return self.template.format(
@@ -204,10 +368,10 @@ class PersonaGenerator:
             occupation=occupation,
             status=status,
             location=location,
-            tube=self._infer_tube_archetype(all_items)[0],
-            archetype=self._infer_tube_archetype(all_items)[1],
-            primary_traits=self._infer_traits(all_items)[0],
-            secondary_traits=self._infer_traits(all_items)[1],
+            tube=self._infer_tube_archetype(frame)[0],
+            archetype=self._infer_tube_archetype(frame)[1],
+            primary_traits=self._infer_traits(frame)[0],
+            secondary_traits=self._infer_traits(frame)[1],
             motivations=self._format_list(motivations),
             behavior=self._format_list(behavior),
             goals=self._format_list(goals),
@@ -215,15 +379,7 @@ class PersonaGenerator:
             quote=quote
         )
 
-    def _get_subreddit_stats(self, items: List[Dict]) -> Dict[str, int]:
-        """Calculate subreddit activity statistics."""
-        subreddits = {}
-        for item in items:
-            sub = item.get('subreddit', 'unknown')
-            subreddits[sub] = subreddits.get(sub, 0) + 1
-        return subreddits
-
-    def _infer_age(self, items: List[Dict]) -> str:
+    def _infer_age(self, frame: ActivityFrame) -> str:
         """Enhanced age inference."""
         age_clues = {
             'teen': 0, 'school': 0, 'college': 0, 'university': 0,
@@ -231,8 +387,7 @@ class PersonaGenerator:
             'kids': 0, 'children': 0, 'retirement': 0
         }
         
-        for item in items:
-            text = (item.get('title', '') + ' ' + item.get('text', '')).lower()
+        for text in frame.lowered('title', 'text'):
             for clue in age_clues:
                 if clue in text:
                     age_clues[clue] += 1
@@ -251,8 +406,34 @@ class PersonaGenerator:
         # Default based on Reddit demographics
         return "25-35"
 
-    def _infer_occupation(self, items: List[Dict]) -> str:
+    def _subreddit_votes(self, subreddits: Optional[Dict[str, int]], field: str,
+                         labels: Optional[Dict[str, str]] = None) -> List[Tuple[str, int]]:
+        """Activity per taxonomy value of ``field`` across the user's subreddits, most first.
+
+        ``labels`` maps taxonomy values to output labels. Values with too little
+        activity to be more than noise are dropped.
+        """
+        taxonomy = get_taxonomy() if subreddits else None
+        if taxonomy is None:
+            return []
+        votes = Counter()
+        for name, count in subreddits.items():
+            entry = taxonomy.lookup(name)
+            value = getattr(entry, field) if entry else None
+            if labels is not None:
+                value = labels.get(value)
+            if value:
+                votes[value] += count
+        floor = max(MIN_SUBREDDIT_ITEMS, MIN_SUBREDDIT_SHARE * sum(subreddits.values()))
+        return [(label, count) for label, count in votes.most_common() if count >= floor]
+
+    def _infer_occupation(self, frame: ActivityFrame, subreddits: Optional[Dict[str, int]] = None) -> str:
         """Enhanced occupation inference."""
+        # Subreddit activity is the strongest signal; keywords are the fallback
+        votes = self._subreddit_votes(subreddits, 'occupation')
+        if votes:
+            return "Legal Professional" if votes[0][0] == 'legal' else votes[0][0].title()
+        
         occupation_keywords = {
             'student': ['school', 'college', 'university', 'homework', 'exam'],
             'tech': ['code', 'programming', 'software', 'developer', 'python'],
@@ -264,8 +445,7 @@ class PersonaGenerator:
         
         keyword_counts = {occ: 0 for occ in occupation_keywords}
         
-        for item in items:
-            text = (item.get('title', '') + ' ' + item.get('text', '')).lower()
+        for text in frame.lowered('title', 'text'):
             for occ, keywords in occupation_keywords.items():
                 for kw in keywords:
                     if kw in text:
@@ -280,7 +460,7 @@ class PersonaGenerator:
             return top_occupations[0][0].title()
         return "Unknown"
 
-    def _infer_location(self, items: List[Dict]) -> str:
+    def _infer_location(self, frame: ActivityFrame, subreddits: Optional[Dict[str, int]] = None) -> str:
         """Enhanced location inference."""
         location_keywords = {
             'Delhi': ['delhi', 'dilli'],
@@ -293,15 +473,20 @@ class PersonaGenerator:
             'UK': ['uk', 'london', 'britain']
         }
         
-        for item in items:
-            text = (item.get('title', '') + ' ' + item.get('text', '')).lower()
+        # Cities come before countries, so the most specific subreddit wins
+        voted = {label for label, _ in self._subreddit_votes(subreddits, 'location')}
+        for loc in location_keywords:
+            if loc in voted:
+                return loc
+        
+        for text in frame.lowered('title', 'text'):
             for loc, keywords in location_keywords.items():
                 if any(kw in text for kw in keywords):
                     return loc
         
         return "Unknown"
 
-    def _infer_relationship_status(self, items: List[Dict]) -> str:
+    def _infer_relationship_status(self, frame: ActivityFrame) -> str:
         """Infer relationship status."""
         status_keywords = {
             'Single': ['single', 'dating', 'boyfriend', 'girlfriend'],
@@ -309,15 +494,14 @@ class PersonaGenerator:
             'Divorced': ['divorced', 'ex-wife', 'ex-husband']
         }
         
-        for item in items:
-            text = (item.get('title', '') + ' ' + item.get('text', '')).lower()
+        for text in frame.lowered('title', 'text'):
             for status, keywords in status_keywords.items():
                 if any(kw in text for kw in keywords):
                     return status
         
         return "Unknown"
 
-    def _infer_tube_archetype(self, items: List[Dict]) -> Tuple[str, str]:
+    def _infer_tube_archetype(self, frame: ActivityFrame) -> Tuple[str, str]:
         """Infer tech adoption and personality archetype."""
         tech_keywords = ['tech', 'gadget', 'smartphone', 'app', 'software']
         creative_keywords = ['create', 'art', 'write', 'design', 'build']
@@ -327,8 +511,7 @@ class PersonaGenerator:
         creative_count = 0
         help_count = 0
         
-        for item in items:
-            text = item.get('text', '').lower()
+        for text in frame.lowered('text'):
             tech_count += sum(1 for kw in tech_keywords if kw in text)
             creative_count += sum(1 for kw in creative_keywords if kw in text)
             help_count += sum(1 for kw in help_keywords if kw in text)
@@ -351,7 +534,7 @@ class PersonaGenerator:
         
         return tube, archetype
 
-    def _infer_traits(self, items: List[Dict]) -> Tuple[str, str]:
+    def _infer_traits(self, frame: ActivityFrame) -> Tuple[str, str]:
         """Enhanced personality trait inference."""
         positive_words = ['great', 'awesome', 'love', 'happy', 'nice']
         negative_words = ['hate', 'terrible', 'awful', 'bad', 'worst']
@@ -365,8 +548,7 @@ class PersonaGenerator:
             'social': 0
         }
         
-        for item in items:
-            text = item.get('text', '').lower()
+        for text in frame.lowered('text'):
             counts['positive'] += sum(1 for w in positive_words if w in text)
             counts['negative'] += sum(1 for w in negative_words if w in text)
             counts['analytical'] += sum(1 for w in analytical_words if w in text)
@@ -386,8 +568,12 @@ class PersonaGenerator:
         
         return primary, secondary
 
-    def _infer_motivations(self, items: List[Dict]) -> List[str]:
+    def _infer_motivations(self, frame: ActivityFrame, subreddits: Optional[Dict[str, int]] = None) -> List[str]:
         """Enhanced motivation inference."""
+        votes = self._subreddit_votes(subreddits, 'category', CATEGORY_MOTIVATIONS)
+        if votes:
+            return [label for label, _ in votes]
+        
         motivations = []
         motivation_keywords = {
             'Learning': ['learn', 'study', 'read', 'knowledge'],
@@ -396,16 +582,19 @@ class PersonaGenerator:
             'Entertainment': ['fun', 'game', 'movie', 'music']
         }
         
-        for item in items:
-            text = item.get('text', '').lower()
+        for text in frame.lowered('text'):
             for mot, keywords in motivation_keywords.items():
                 if any(kw in text for kw in keywords) and mot not in motivations:
                     motivations.append(mot)
         
         return motivations or ["Unknown"]
 
-    def _infer_goals(self, items: List[Dict]) -> List[str]:
+    def _infer_goals(self, frame: ActivityFrame, subreddits: Optional[Dict[str, int]] = None) -> List[str]:
         """Enhanced goal inference."""
+        votes = self._subreddit_votes(subreddits, 'category', CATEGORY_GOALS)
+        if votes:
+            return [label for label, _ in votes]
+        
         goals = []
         goal_keywords = {
             'Career growth': ['promotion', 'career', 'job', 'work'],
@@ -414,15 +603,14 @@ class PersonaGenerator:
             'Financial': ['money', 'save', 'invest', 'rich']
         }
         
-        for item in items:
-            text = item.get('text', '').lower()
+        for text in frame.lowered('text'):
             for goal, keywords in goal_keywords.items():
                 if any(kw in text for kw in keywords) and goal not in goals:
                     goals.append(goal)
         
         return goals or ["Unknown"]
 
-    def _infer_frustrations(self, items: List[Dict]) -> List[str]:
+    def _infer_frustrations(self, frame: ActivityFrame) -> List[str]:
         """Enhanced frustration inference."""
         frustrations = []
         frustration_keywords = {
@@ -432,49 +620,45 @@ class PersonaGenerator:
             'Personal': ['lonely', 'tired', 'sick', 'angry']
         }
         
-        for item in items:
-            text = item.get('text', '').lower()
+        for text in frame.lowered('text'):
             for frust, keywords in frustration_keywords.items():
                 if any(kw in text for kw in keywords) and frust not in frustrations:
                     frustrations.append(frust)
         
         return frustrations or ["Unknown"]
 
-    def _find_representative_quote(self, items: List[Dict]) -> str:
+    def _find_representative_quote(self, frame: ActivityFrame) -> str:
         """Find most representative quote with context."""
-        if not items:
+        if not len(frame):
             return "No representative quote available"
         
         # Find the most upvoted item
-        most_upvoted = max(items, key=lambda x: x.get('upvotes', 0))
-        text = most_upvoted.get('text', most_upvoted.get('title', ''))
+        most_upvoted = int(np.argmax(frame.upvotes))
+        text = frame.field(most_upvoted, 'text' if frame.has(most_upvoted, 'text') else 'title')
         
         # Add context if available
-        subreddit = most_upvoted.get('subreddit', '')
+        subreddit = frame.subreddit(most_upvoted)
         if subreddit:
             return f"[r/{subreddit}] {text[:200]}..." if len(text) > 200 else text
         return text[:200] + "..." if len(text) > 200 else text
 
-    def _infer_posting_times(self, items: List[Dict]) -> str:
+    def _infer_posting_times(self, frame: ActivityFrame) -> str:
         """Infer typical posting times."""
-        if not items:
+        if not len(frame):
             return "Unknown"
         
         # Count posts by hour (UTC)
-        hours = [0]*24
-        for item in items:
-            if 'created_utc' in item:
-                hour = datetime.utcfromtimestamp(item['created_utc']).hour
-                hours[hour] += 1
+        hours = frame.hour_histogram()
         
         # Find peak hours
-        peak_hours = sorted(range(24), key=lambda x: hours[x], reverse=True)[:2]
+        peak_hours = np.argsort(-hours, kind='stable')[:2]
         return f"{peak_hours[0]}:00-{peak_hours[0]+1}:00 UTC, {peak_hours[1]}:00-{peak_hours[1]+1}:00 UTC"
 
-    def _infer_engagement_style(self, items: List[Dict]) -> str:
+    def _infer_engagement_style(self, frame: ActivityFrame) -> str:
         """Infer how the user engages with others."""
-        question_count = sum(1 for item in items if '?' in item.get('text', ''))
-        answer_count = sum(1 for item in items if '?' not in item.get('text', '') and item.get('text', ''))
+        texts = frame.strings('text')
+        question_count = sum(1 for text in texts if '?' in text)
+        answer_count = sum(1 for text in texts if '?' not in text and text)
         
         if question_count > answer_count * 2:
             return "Mostly asks questions"
@@ -482,19 +666,19 @@ class PersonaGenerator:
             return "Mostly provides answers"
         return "Balanced questions and answers"
 
-    def _find_specific_behaviors(self, items: List[Dict]) -> List[str]:
+    def _find_specific_behaviors(self, frame: ActivityFrame) -> List[str]:
         """Identify specific behavioral patterns."""
         behaviors = []
         
         # Check for meme usage
         meme_keywords = ['meme', 'lol', 'haha', 'funny']
-        meme_count = sum(1 for item in items if any(kw in item.get('text', '').lower() for kw in meme_keywords))
+        meme_count = sum(1 for text in frame.lowered('text') if any(kw in text for kw in meme_keywords))
         if meme_count > 2:
             behaviors.append(f"Frequently shares memes/humor ({meme_count} instances)")
         
         # Check for political engagement
         political_keywords = ['politics', 'government', 'vote', 'election']
-        political_count = sum(1 for item in items if any(kw in item.get('text', '').lower() for kw in political_keywords))
+        political_count = sum(1 for text in frame.lowered('text') if any(kw in text for kw in political_keywords))
         if political_count > 2:
             behaviors.append(f"Engages in political discussions ({political_count} instances)")
         
@@ -504,22 +688,80 @@ class PersonaGenerator:
         """Format list for template."""
         return "\n".join(f"- {item}" for item in items) if items else "- No data available"
     
-    def generate_persona_json(self, username: str, posts: List[Dict], comments: List[Dict]) -> Dict:
+    def generate_persona_json(self, username: str, frame: ActivityFrame) -> Dict:
         """Generate persona as structured JSON data."""
-        if not posts and not comments:
+        if not len(frame):
             return self._create_empty_persona_json(username)
         
-        combined_text = self._combine_text_data(posts, comments)
+        combined_text = self._combine_text_data(frame)
         
         try:
             analysis = self._analyze_with_together_api(username, combined_text)
-            # Ensure the photo is included in the API response
-            if 'photo' not in analysis:
-                analysis['photo'] = self._get_user_photo(username)
-            return analysis
+            return self._llm_persona_json(username, analysis, frame)
         except Exception as e:
             print(f"Together API failed, using heuristic analysis: {e}")
-            return self._heuristic_analysis_json(username, posts, comments)
+            return self._heuristic_analysis_json(username, frame)
+
+    def _llm_persona_json(self, username: str, analysis: Dict, frame: ActivityFrame) -> Dict:
+        persona = self._normalize_persona(analysis, username, 'llm')
+        # Ensure the photo is included in the API response
+        persona['photo'] = analysis.get('photo') or self._get_user_photo(username)
+        persona['timeline'] = build_timeline(frame)
+        return persona
+
+    def generate_persona_progressive(self, username: str, frame: ActivityFrame,
+                                     on_upgrade: Callable[[Dict], None]) -> Dict:
+        """Return the heuristic persona right away and upgrade it with the LLM in the background.
+
+        The returned persona has ``tier: 'heuristic'`` and ``upgrading: True``.
+        Once the Together call finishes, ``on_upgrade`` is called from a worker
+        thread with the fields to merge into it: the LLM persona fields with
+        ``tier: 'llm'`` on success, or just ``upgrading: False`` on failure.
+        """
+        if not len(frame):
+            return self._create_empty_persona_json(username)
+
+        persona = self._heuristic_analysis_json(username, frame)
+        persona['upgrading'] = True
+        self._upgrade_pool().submit(self._upgrade_persona, username, self._combine_text_data(frame), on_upgrade)
+        return persona
+
+    def _upgrade_pool(self) -> ThreadPoolExecutor:
+        if self._upgrades is None:
+            self._upgrades = ThreadPoolExecutor(max_workers=int(os.getenv('PERSONA_UPGRADE_WORKERS', 4)),
+                                                thread_name_prefix='persona-upgrade')
+        return self._upgrades
+
+    def _upgrade_persona(self, username: str, combined_text: str, on_upgrade: Callable[[Dict], None]):
+        fields = {'upgrading': False}
+        try:
+            analysis = self._analyze_with_together_api(username, combined_text)
+            fields.update(self._normalize_persona(analysis, username, 'llm'))
+            del fields['username']
+        except Exception as e:
+            print(f"Together API failed, keeping heuristic persona for {username}: {e}")
+        try:
+            on_upgrade(fields)
+        except Exception as e:
+            print(f"Couldn't store upgraded persona for {username}: {e}")
+
+    def _normalize_persona(self, data: Dict, username: str, tier: str) -> Dict:
+        """Coerce persona data to the shared schema, so both tiers render the same way."""
+        persona = {'username': username, 'tier': tier}
+        for field in PERSONA_TEXT_FIELDS:
+            value = data.get(field)
+            if isinstance(value, list):
+                value = ', '.join(str(v) for v in value)
+            persona[field] = str(value).strip() if value not in (None, '') else "Unknown"
+        for field in PERSONA_LIST_FIELDS:
+            value = data.get(field)
+            if isinstance(value, str):
+                value = [value]
+            items = [str(v).strip() for v in value or [] if v not in (None, '')]
+            persona[field] = items or ["No data available"]
+        if persona['name'] == "Unknown":
+            persona['name'] = username
+        return persona
 
     def _get_user_photo(self, username: str) -> str:
         """Get user photo URL or generate default avatar.
@@ -560,34 +802,31 @@ class PersonaGenerator:
         
         return f"data:image/svg+xml;base64,{base64.b64encode(svg.encode()).decode()}"
 
-    def _heuristic_analysis_json(self, username: str, posts: List[Dict], comments: List[Dict]) -> Dict:
+    def _heuristic_analysis_json(self, username: str, frame: ActivityFrame) -> Dict:
         """Comprehensive analysis using multiple inference methods, returning JSON."""
-        # Combine all activity items
-        all_items = posts + comments
-        
         # Basic metrics
-        subreddits = self._get_subreddit_stats(all_items)
-        total_posts = len(posts)
-        total_comments = len(comments)
+        subreddits = frame.subreddit_counts()
+        total_posts = len(frame.indices(POST))
+        total_comments = len(frame.indices(COMMENT))
         most_active_subreddits = sorted(subreddits.items(), key=lambda x: x[1], reverse=True)[:3]
         
         # Detailed inferences
         persona = {
             'username': username,
             'name': username,  # Default to username if name not found
-            'age': self._infer_age(all_items),
-            'occupation': self._infer_occupation(all_items),
-            'status': self._infer_relationship_status(all_items),
-            'location': self._infer_location(all_items),
-            'tube': self._infer_tube_archetype(all_items)[0],
-            'archetype': self._infer_tube_archetype(all_items)[1],
-            'primary_traits': self._infer_traits(all_items)[0],
-            'secondary_traits': self._infer_traits(all_items)[1],
-            'motivations': self._infer_motivations(all_items),
+            'age': self._infer_age(frame),
+            'occupation': self._infer_occupation(frame, subreddits),
+            'status': self._infer_relationship_status(frame),
+            'location': self._infer_location(frame, subreddits),
+            'tube': self._infer_tube_archetype(frame)[0],
+            'archetype': self._infer_tube_archetype(frame)[1],
+            'primary_traits': self._infer_traits(frame)[0],
+            'secondary_traits': self._infer_traits(frame)[1],
+            'motivations': self._infer_motivations(frame, subreddits),
             'behavior': [],
-            'goals': self._infer_goals(all_items),
-            'frustrations': self._infer_frustrations(all_items),
-            'quote': self._find_representative_quote(all_items),
+            'goals': self._infer_goals(frame, subreddits),
+            'frustrations': self._infer_frustrations(frame),
+            'quote': self._find_representative_quote(frame),
             'photo': "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iNDAwIiBoZWlnaHQ9IjI4MCIgdmlld0JveD0iMCAwIDQwMCAyODAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSI0MDAiIGhlaWdodD0iMjgwIiBmaWxsPSIjOEI3MzU1Ii8+CjxjaXJjbGUgY3g9IjIwMCIgY3k9IjEyMCIgcj0iNDAiIGZpbGw9IiNGRkY1RjAiLz4KPHJlY3QgeD0iMTcwIiB5PSIxNzAiIHdpZHRoPSI2MCIgaGVpZ2h0PSI4MCIgcng9IjEwIiBmaWxsPSIjNjhBRTVCIi8+CjxyZWN0IHg9IjE2MCIgeT0iMjMwIiB3aWR0aD0iODAiIGhlaWdodD0iNTAiIHJ4PSI1IiBmaWxsPSIjRkY1NzMzIi8+CjxyZWN0IHg9IjE4NSIgeT0iMTAwIiB3aWR0aD0iMzAiIGhlaWdodD0iMTAiIHJ4PSI1IiBmaWxsPSIjMzMzIi8+CjwvdXZnPgo="
         }
         
@@ -596,16 +835,19 @@ class PersonaGenerator:
             f"Active in {len(subreddits)} subreddits",
             f"Has made {total_posts} posts and {total_comments} comments",
             f"Most active in: {', '.join([f'r/{s[0]} ({s[1]} activities)' for s in most_active_subreddits])}",
-            f"Most frequent posting times: {self._infer_posting_times(all_items)}",
-            f"Engagement style: {self._infer_engagement_style(all_items)}"
+            f"Most frequent posting times: {self._infer_posting_times(frame)}",
+            f"Engagement style: {self._infer_engagement_style(frame)}"
         ]
         
         # Add specific behaviors if found
-        specific_behaviors = self._find_specific_behaviors(all_items)
+        specific_behaviors = self._find_specific_behaviors(frame)
         behavior.extend(specific_behaviors)
         persona['behavior'] = behavior
         
-        return persona
+        normalized = self._normalize_persona(persona, username, 'heuristic')
+        normalized['photo'] = persona['photo']
+        normalized['timeline'] = build_timeline(frame)
+        return normalized
 
     def _create_empty_persona_json(self, username: str) -> Dict:
         """Create empty persona as JSON."""
@@ -624,7 +866,8 @@ class PersonaGenerator:
             'behavior': ["No data available"],
             'goals': ["No data available"],
             'frustrations': ["No data available"],
-            'quote': "No representative quote available"
+            'quote': "No representative quote available",
+            'tier': 'heuristic'
         }
         
     def _create_empty_persona(self, username: str) -> str:
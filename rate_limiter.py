@@ -0,0 +1,199 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Lower value = served first. Interactive requests jump ahead of bulk jobs.
+PRIORITIES = {
+    'interactive': 0,
+    'bulk': 1,
+}
+
+# Waiters that stop polling for this long are assumed dead and dropped
+STALE_WAITER_SECONDS = 10.0
+# Longest a waiter sleeps between polls, well inside the stale window so a
+# live waiter's heartbeat never lapses even when tokens are far off
+MAX_POLL_SECONDS = STALE_WAITER_SECONDS / 4
+
+
+class RateLimitScheduler:
+    """Token bucket shared by every process on the host.
+
+    State lives in a small SQLite database, so web workers, the CLI and batch
+    jobs all draw from the same per-client Reddit quota. Callers queue in a
+    waiters table and tokens are always granted to the oldest waiter of the
+    most urgent priority class.
+    """
+
+    def __init__(self, path: Optional[str] = None, rate: Optional[float] = None,
+                 burst: Optional[float] = None, name: str = 'reddit'):
+        self.path = path or os.getenv(
+            'REDDIT_RATE_LIMIT_DB', os.path.join(tempfile.gettempdir(), 'reddit_rate_limit.sqlite3'))
+        self.rate = rate or float(os.getenv('REDDIT_RATE_LIMIT_QPM', 100)) / 60.0
+        self.burst = burst or float(os.getenv('REDDIT_RATE_LIMIT_BURST', 10))
+        self.name = name
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._waits = {priority: deque(maxlen=1000) for priority in PRIORITIES}
+        self._counts = {priority: 0 for priority in PRIORITIES}
+        self._max_wait = {priority: 0.0 for priority in PRIORITIES}
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (sqlite3 connections aren't thread-safe)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        try:
+            conn = self._connect()
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS waiters (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'bucket TEXT, priority INTEGER, enqueued REAL, heartbeat REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS waiters_order ON waiters (bucket, priority, id)')
+            conn.execute('INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)', (self.name, self.burst, time.time()))
+        except sqlite3.Error as e:
+            print(f"Rate limit scheduler unavailable, requests will not be throttled: {e}")
+
+    def acquire(self, priority: str = 'interactive', timeout: Optional[float] = None) -> float:
+        """Block until a token is granted; return the seconds spent waiting."""
+        level = PRIORITIES[priority]
+        start = time.time()
+        try:
+            conn = self._connect()
+            cursor = conn.execute(
+                'INSERT INTO waiters (bucket, priority, enqueued, heartbeat) VALUES (?, ?, ?, ?)',
+                (self.name, level, start, start))
+            waiter_id = cursor.lastrowid
+        except sqlite3.Error as e:
+            print(f"Rate limit scheduler error, not throttling: {e}")
+            return 0.0
+
+        try:
+            while True:
+                delay = self._try_take(conn, waiter_id, level, start)
+                if delay is None:
+                    break
+                if timeout is not None and time.time() - start + delay > timeout:
+                    raise TimeoutError(f"No Reddit rate-limit token within {timeout}s")
+                time.sleep(delay)
+        except sqlite3.Error as e:
+            print(f"Rate limit scheduler error, not throttling: {e}")
+        finally:
+            try:
+                conn.execute('DELETE FROM waiters WHERE id = ?', (waiter_id,))
+            except sqlite3.Error:
+                pass
+
+        waited = time.time() - start
+        self._record(priority, waited)
+        return waited
+
+    def _try_take(self, conn: sqlite3.Connection, waiter_id: int, level: int,
+                  enqueued: float) -> Optional[float]:
+        """Take a token if this waiter is at the head of the queue.
+
+        Returns None on success, otherwise how long to sleep before retrying.
+        A waiter whose row was dropped as stale (e.g. the process was
+        suspended) is re-inserted under its original id, keeping its place.
+        """
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            conn.execute('DELETE FROM waiters WHERE bucket = ? AND heartbeat < ?',
+                         (self.name, now - STALE_WAITER_SECONDS))
+            if not conn.execute('UPDATE waiters SET heartbeat = ? WHERE id = ?', (now, waiter_id)).rowcount:
+                conn.execute(
+                    'INSERT INTO waiters (id, bucket, priority, enqueued, heartbeat) VALUES (?, ?, ?, ?, ?)',
+                    (waiter_id, self.name, level, enqueued, now))
+            tokens, updated = conn.execute(
+                'SELECT tokens, updated FROM buckets WHERE name = ?', (self.name,)).fetchone()
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            head = conn.execute(
+                'SELECT id FROM waiters WHERE bucket = ? ORDER BY priority, id LIMIT 1',
+                (self.name,)).fetchone()
+
+            is_head = head is not None and head[0] == waiter_id
+            took = is_head and tokens >= 1
+            if took:
+                tokens -= 1
+            conn.execute('UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?',
+                         (tokens, now, self.name))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        if took:
+            return None
+        if is_head:
+            # Sleep until the next token is due, waking to heartbeat if that's far off
+            return min(MAX_POLL_SECONDS, max(0.001, (1 - tokens) / self.rate))
+        # Not our turn yet: poll quickly so the queue keeps moving
+        return min(0.05, 1 / self.rate)
+
+    def _record(self, priority: str, waited: float):
+        with self._stats_lock:
+            self._counts[priority] += 1
+            self._waits[priority].append(waited)
+            self._max_wait[priority] = max(self._max_wait[priority], waited)
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Number of callers currently waiting, across all processes."""
+        names = {level: name for name, level in PRIORITIES.items()}
+        depth = {name: 0 for name in PRIORITIES}
+        try:
+            rows = self._connect().execute(
+                'SELECT priority, COUNT(*) FROM waiters WHERE bucket = ? GROUP BY priority', (self.name,))
+            for level, count in rows:
+                if level in names:
+                    depth[names[level]] = count
+        except sqlite3.Error as e:
+            print(f"Couldn't read rate limit queue: {e}")
+        return depth
+
+    def metrics(self) -> Dict:
+        """Queue wait statistics for this process, plus the host-wide queue depth."""
+        with self._stats_lock:
+            wait_stats = {}
+            for priority, waits in self._waits.items():
+                recent = sorted(waits)
+                wait_stats[priority] = {
+                    'requests': self._counts[priority],
+                    'mean_wait_seconds': round(sum(recent) / len(recent), 4) if recent else 0.0,
+                    'p95_wait_seconds': round(recent[int(0.95 * (len(recent) - 1))], 4) if recent else 0.0,
+                    'max_wait_seconds': round(self._max_wait[priority], 4),
+                }
+        return {
+            'rate_per_second': self.rate,
+            'burst': self.burst,
+            'queue_depth': self.queue_depth(),
+            'wait': wait_stats,
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RateLimitScheduler:
+    """Return the process-wide scheduler for Reddit calls."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RateLimitScheduler()
+        return _scheduler
@@ -1,23 +1,45 @@
 import praw
 from praw.models import Redditor
+from prawcore import Requestor
 import requests
 from bs4 import BeautifulSoup
 import os
 from dotenv import load_dotenv
 from typing import List, Dict, Tuple
-import time
+from rate_limiter import get_scheduler
+from activity_frame import ActivityFrame, ActivityFrameBuilder, POST, COMMENT
 
 load_dotenv()
 
+class ScheduledRequestor(Requestor):
+    """praw requestor that takes a token from the shared rate-limit scheduler per HTTP call."""
+
+    def __init__(self, *args, priority: str = 'interactive', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.priority = priority
+        self.scheduler = get_scheduler()
+
+    def request(self, *args, **kwargs):
+        self.scheduler.acquire(self.priority)
+        return super().request(*args, **kwargs)
+
 class RedditScraper:
-    def __init__(self):
-        """Initialize with more robust error handling."""
+    def __init__(self, priority: str = 'interactive'):
+        """Initialize with more robust error handling.
+
+        ``priority`` is the rate-limit class for this scraper's Reddit calls:
+        'interactive' for user-facing requests, 'bulk' for batch jobs.
+        """
         self.api_available = False
+        self.priority = priority
+        self.scheduler = get_scheduler()
         try:
             self.reddit = praw.Reddit(
                 client_id=os.getenv('REDDIT_CLIENT_ID'),
                 client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
-                user_agent='UserPersonaGenerator/2.0'
+                user_agent='UserPersonaGenerator/2.0',
+                requestor_class=ScheduledRequestor,
+                requestor_kwargs={'priority': priority}
             )
             # Test the connection
             _ = self.reddit.user.me()
@@ -26,65 +48,65 @@ class RedditScraper:
             print(f"PRAW initialization failed: {e}")
             self.api_available = False
 
-    def get_user_data(self, username: str) -> Tuple[List[Dict], List[Dict]]:
-        """Enhanced data collection with better fallback."""
+    def get_user_frame(self, username: str) -> ActivityFrame:
+        """Enhanced data collection with better fallback.
+
+        Items go straight from the API into a columnar frame, with no dict per item.
+        """
         try:
             if self.api_available:
                 return self._get_via_api(username)
             return self._get_via_scraping(username)
         except Exception as e:
             print(f"Error getting user data: {e}")
-            return [], []
+            return ActivityFrameBuilder().build()
 
-    def _get_via_api(self, username: str) -> Tuple[List[Dict], List[Dict]]:
+    def get_user_data(self, username: str) -> Tuple[List[Dict], List[Dict]]:
+        """The user's activity as ``(posts, comments)`` dict lists."""
+        return self.get_user_frame(username).to_items()
+
+    def _get_via_api(self, username: str) -> ActivityFrame:
         """More comprehensive API data collection."""
         try:
             redditor = self.reddit.redditor(username)
+            builder = ActivityFrameBuilder()
             
-            posts = []
             for post in redditor.submissions.new(limit=100):
-                posts.append({
-                    'title': post.title,
-                    'text': post.selftext,
-                    'created_utc': post.created_utc,
-                    'subreddit': str(post.subreddit),
-                    'upvotes': post.score,
-                    'url': post.url,
-                    'type': 'post'
-                })
-                time.sleep(0.5)  # Rate limiting
+                self.add_post(builder, post)
             
-            comments = []
             for comment in redditor.comments.new(limit=100):
-                comments.append({
-                    'text': comment.body,
-                    'created_utc': comment.created_utc,
-                    'subreddit': str(comment.subreddit),
-                    'upvotes': comment.score,
-                    'url': f"https://reddit.com{comment.permalink}",
-                    'type': 'comment'
-                })
-                time.sleep(0.5)
+                self.add_comment(builder, comment)
             
-            return posts, comments
+            return builder.build()
             
         except Exception as e:
             print(f"API failed: {e}")
             return self._get_via_scraping(username)
 
-    def _get_via_scraping(self, username: str) -> Tuple[List[Dict], List[Dict]]:
+    def add_post(self, builder: ActivityFrameBuilder, post):
+        """Add a praw submission to a frame being built."""
+        builder.add(POST, id=post.id, title=post.title, text=post.selftext, url=post.url,
+                    created_utc=post.created_utc, subreddit=str(post.subreddit), upvotes=post.score)
+
+    def add_comment(self, builder: ActivityFrameBuilder, comment):
+        """Add a praw comment to a frame being built."""
+        builder.add(COMMENT, id=comment.id, text=comment.body, url=f"https://reddit.com{comment.permalink}",
+                    created_utc=comment.created_utc, subreddit=str(comment.subreddit), upvotes=comment.score)
+
+    def _get_via_scraping(self, username: str) -> ActivityFrame:
         """More robust scraping fallback."""
         print("Falling back to web scraping...")
-        base_url = f"https://www.reddit.com/user/{username}/"
+        base_url = f"{os.getenv('REDDIT_WEB_URL', 'https://www.reddit.com')}/user/{username}/"
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         
         try:
+            self.scheduler.acquire(self.priority)
             response = requests.get(base_url, headers=headers, timeout=10)
             soup = BeautifulSoup(response.text, 'html.parser')
             
-            data = []
+            builder = ActivityFrameBuilder()
             for item in soup.find_all('div', {'class': 'Post'}):
                 try:
                     title = item.find('h3', class_='_eYtD2XCVieq6emjKBH3m')
@@ -93,22 +115,18 @@ class RedditScraper:
                     timestamp = item.find('a', class_='_3jOxDPIQ0KaOWpzvSQo-1s')
                     
                     if title:
-                        data.append({
-                            'title': title.text,
-                            'text': text.text if text else '',
-                            'subreddit': subreddit.text if subreddit else '',
-                            'url': f"https://reddit.com{timestamp['href']}" if timestamp else '',
-                            'type': 'post' if text else 'comment'
-                        })
+                        builder.add(
+                            POST if text else COMMENT,
+                            title=title.text,
+                            text=text.text if text else '',
+                            subreddit=subreddit.text if subreddit else '',
+                            url=f"https://reddit.com{timestamp['href']}" if timestamp else ''
+                        )
                 except Exception as e:
                     print(f"Error parsing item: {e}")
             
-            # Separate posts and comments
-            posts = [item for item in data if item['type'] == 'post']
-            comments = [item for item in data if item['type'] == 'comment']
-            
-            return posts, comments
+            return builder.build()
             
         except Exception as e:
             print(f"Scraping failed: {e}")
-            return [], []
\ No newline at end of file
+            return ActivityFrameBuilder().build()
\ No newline at end of file
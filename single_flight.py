@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+def normalize_username(username: str) -> str:
+    """Normalize a Reddit username so equivalent spellings share one key."""
+    name = username.strip()
+    for prefix in ('/u/', 'u/', '/user/', 'user/'):
+        if name.lower().startswith(prefix):
+            name = name[len(prefix):]
+            break
+    return name.strip('/').lower()
+
+
+class _Call:
+    """One in-flight (or recently finished) pipeline run."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.finished_at = 0.0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    runs block and receive the same result (or exception). Successful results
+    are kept for ``grace_period`` seconds so late arrivals are served too.
+    """
+
+    def __init__(self, grace_period: float = 10.0):
+        self.grace_period = grace_period
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run ``fn`` for ``key`` unless an identical call is running or just finished."""
+        with self._lock:
+            self._evict_expired()
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.finished_at = time.monotonic()
+            with self._lock:
+                # Failures are not cached: the next caller retries
+                if call.error is not None or self.grace_period <= 0:
+                    self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def forget(self, key: str):
+        """Drop a cached result so the next call for ``key`` runs again."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set():
+                del self._calls[key]
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [
+            key for key, call in self._calls.items()
+            if call.done.is_set() and now - call.finished_at >= self.grace_period
+        ]
+        for key in expired:
+            del self._calls[key]
@@ -0,0 +1,191 @@
+import csv
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+SOURCE_PATH = os.path.join(DATA_DIR, 'subreddit_taxonomy.csv')
+INDEX_PATH = os.path.join(DATA_DIR, 'subreddit_taxonomy.bin')
+
+MAGIC = b'SRTX'
+VERSION = 1
+# magic, version, slot count, entry count, string count, FNV-1a of the source CSV
+HEADER = struct.Struct('<4sIIIIQ')
+# subreddit hash, then string-table indices of category, occupation and location (0 = none)
+SLOT = struct.Struct('<QHHH2x')
+
+FNV_OFFSET = 0xcbf29ce484222325
+FNV_PRIME = 0x100000001b3
+
+
+class TaxonomyEntry(NamedTuple):
+    category: Optional[str]
+    occupation: Optional[str]
+    location: Optional[str]
+
+
+def fnv1a_64(data: bytes) -> int:
+    h = FNV_OFFSET
+    for byte in data:
+        h = ((h ^ byte) * FNV_PRIME) & 0xFFFFFFFFFFFFFFFF
+    # 0 marks an empty slot
+    return h or 1
+
+
+def _key(subreddit: str) -> bytes:
+    return subreddit.strip().strip('/').split('/')[-1].lower().encode('utf-8')
+
+
+def build_index(rows: List[Dict[str, str]], source_hash: int = 0) -> bytes:
+    """Lay out taxonomy rows as an open-addressing hash table plus a string table."""
+    strings = ['']
+    string_ids = {'': 0}
+
+    def intern(value):
+        value = (value or '').strip()
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    entries = {}
+    for row in rows:
+        key = _key(row['subreddit'])
+        if not key:
+            continue
+        h = fnv1a_64(key)
+        if h in entries and entries[h][0] != key:
+            raise ValueError(f"Hash collision between r/{entries[h][0].decode()} and r/{key.decode()}")
+        entries[h] = (key, intern(row.get('category')), intern(row.get('occupation')), intern(row.get('location')))
+
+    # Power-of-two table at most half full keeps probe chains short
+    n_slots = 8
+    while n_slots < 2 * len(entries):
+        n_slots *= 2
+    table = bytearray(n_slots * SLOT.size)
+    for h, (_, category, occupation, location) in entries.items():
+        i = h & (n_slots - 1)
+        while struct.unpack_from('<Q', table, i * SLOT.size)[0]:
+            i = (i + 1) & (n_slots - 1)
+        SLOT.pack_into(table, i * SLOT.size, h, category, occupation, location)
+
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = [0]
+    for s in encoded:
+        offsets.append(offsets[-1] + len(s))
+    string_table = struct.pack(f'<{len(offsets)}I', *offsets) + b''.join(encoded)
+
+    header = HEADER.pack(MAGIC, VERSION, n_slots, len(entries), len(strings), source_hash)
+    return header + bytes(table) + string_table
+
+
+def compile_taxonomy(source: str = SOURCE_PATH, path: Optional[str] = INDEX_PATH) -> bytes:
+    """Compile the taxonomy CSV; writes the index to ``path`` (atomically) unless it is None."""
+    with open(source, 'rb') as f:
+        raw = f.read()
+    rows = list(csv.DictReader(raw.decode('utf-8').splitlines()))
+    data = build_index(rows, fnv1a_64(raw))
+    if path is not None:
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return data
+
+
+class SubredditTaxonomy:
+    """Subreddit -> (category, occupation, location) lookups from a compiled index.
+
+    The index file is memory-mapped read-only, so opening it costs the same
+    however big it is and every worker process shares the same pages. It is
+    (re)compiled from the CSV when missing, from an older format, or built
+    from a different version of the CSV.
+    """
+
+    def __init__(self, path: str = INDEX_PATH, source: Optional[str] = SOURCE_PATH):
+        self.path = path
+        self.source = source
+        self._buffer = self._open()
+        magic, version, self.n_slots, self.n_entries, n_strings, _ = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a subreddit taxonomy index")
+        self._slots = HEADER.size
+        offsets_at = self._slots + self.n_slots * SLOT.size
+        self._offsets = struct.unpack_from(f'<{n_strings + 1}I', self._buffer, offsets_at)
+        self._strings_at = offsets_at + (n_strings + 1) * 4
+        self._string_cache = {}
+
+    def _open(self):
+        if self.source is not None and self._is_stale():
+            try:
+                compile_taxonomy(self.source, self.path)
+            except OSError as e:
+                # Read-only install: keep the compiled index in memory instead
+                print(f"Couldn't write {self.path}, using an in-memory taxonomy index: {e}")
+                return compile_taxonomy(self.source, None)
+        with open(self.path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _is_stale(self) -> bool:
+        try:
+            with open(self.path, 'rb') as f:
+                magic, version, _, _, _, source_hash = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                return True
+            if os.path.getmtime(self.source) <= os.path.getmtime(self.path):
+                return False
+            # Checkouts don't preserve mtimes, so confirm against the source hash
+            with open(self.source, 'rb') as f:
+                return source_hash != fnv1a_64(f.read())
+        except (OSError, struct.error):
+            return True
+
+    def _string(self, index: int) -> Optional[str]:
+        if not index:
+            return None
+        value = self._string_cache.get(index)
+        if value is None:
+            start, end = self._offsets[index], self._offsets[index + 1]
+            value = bytes(self._buffer[self._strings_at + start:self._strings_at + end]).decode('utf-8')
+            self._string_cache[index] = value
+        return value
+
+    def lookup(self, subreddit: str) -> Optional[TaxonomyEntry]:
+        if not subreddit:
+            return None
+        h = fnv1a_64(_key(subreddit))
+        mask = self.n_slots - 1
+        i = h & mask
+        while True:
+            slot_hash, category, occupation, location = SLOT.unpack_from(self._buffer, self._slots + i * SLOT.size)
+            if slot_hash == 0:
+                return None
+            if slot_hash == h:
+                return TaxonomyEntry(self._string(category), self._string(occupation), self._string(location))
+            i = (i + 1) & mask
+
+    def __contains__(self, subreddit: str) -> bool:
+        return self.lookup(subreddit) is not None
+
+    def __len__(self) -> int:
+        return self.n_entries
+
+
+_taxonomy = None
+_taxonomy_loaded = False
+_taxonomy_lock = threading.Lock()
+
+
+def get_taxonomy() -> Optional[SubredditTaxonomy]:
+    """Return the process-wide taxonomy, or None if it can't be loaded."""
+    global _taxonomy, _taxonomy_loaded
+    with _taxonomy_lock:
+        if not _taxonomy_loaded:
+            try:
+                _taxonomy = SubredditTaxonomy()
+            except (OSError, ValueError) as e:
+                print(f"Subreddit taxonomy unavailable, using keyword inference only: {e}")
+            _taxonomy_loaded = True
+        return _taxonomy
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules live at the repository root, as they do for main.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
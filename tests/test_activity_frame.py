@@ -0,0 +1,49 @@
+from activity_frame import ActivityFrame, ActivityFrameBuilder, POST
+
+
+POSTS = [
+    {'id': 'p1', 'title': 'Hello', 'text': 'body', 'url': 'https://example.com', 'created_utc': 1700000000.0,
+     'subreddit': 'python', 'upvotes': 3, 'type': 'post'},
+    # Absent keys stay absent
+    {'id': 'p2', 'title': 'Sparse'},
+    # Keys present with None, and values of other types
+    {'id': 'p3', 'title': None, 'text': None, 'url': None, 'created_utc': None, 'subreddit': None,
+     'upvotes': None, 'type': None},
+    {'id': 'p4', 'title': 42, 'created_utc': 1700000000, 'upvotes': 2.5, 'type': 'comment'},
+]
+COMMENTS = [
+    {'id': 'c1', 'text': 'a comment', 'created_utc': 1700003600.0, 'subreddit': 'rust', 'upvotes': -1,
+     'type': 'comment', 'permalink': '/r/rust/c1', 'awards': ['gold']},
+    {'text': ''},
+]
+
+
+def test_round_trip_keeps_absent_keys_none_values_and_extras():
+    frame = ActivityFrame.from_items(POSTS, COMMENTS)
+
+    posts, comments = frame.to_items()
+
+    assert posts == POSTS and comments == COMMENTS
+    assert [list(item) for item in posts] == [list(item) for item in POSTS]
+    assert type(posts[3]['created_utc']) is int and type(posts[3]['upvotes']) is float
+
+
+def test_columns_hold_what_they_can_of_odd_values():
+    frame = ActivityFrame.from_items(POSTS, COMMENTS)
+
+    assert frame.upvotes.tolist() == [3, 0, 0, 2, -1, 0]
+    assert frame.hour_histogram().sum() == 3
+    assert frame.strings('title')[2:4] == ['', '']
+    assert frame.subreddit_counts() == {'python': 1, 'rust': 1, 'unknown': 4}
+
+
+def test_concat_and_exclude_keep_the_round_trip():
+    first = ActivityFrame.from_items(POSTS[:2], COMMENTS[:1])
+    second = ActivityFrame.from_items(POSTS[2:], COMMENTS[1:])
+
+    assert ActivityFrame.concat([first, second]).to_items() == (POSTS, COMMENTS)
+
+    builder = ActivityFrameBuilder()
+    for item in POSTS:
+        builder.add_item(item, POST)
+    assert builder.build(exclude={'p1', 'p2'}).to_items() == (POSTS[2:], [])
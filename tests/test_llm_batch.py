@@ -0,0 +1,93 @@
+import json
+from types import SimpleNamespace
+
+from together.types import BatchCreateResponse, BatchJob
+
+from activity_frame import ActivityFrameBuilder, POST
+from llm_batch import run_batch_job
+from persona_template import PersonaGenerator
+
+
+class FakeTogether:
+    """Just enough of the Together client for a batch job that completes after a few polls."""
+
+    def __init__(self, reply, polls=2, warning=None):
+        self.reply = reply
+        self.polls = polls
+        self.warning = warning
+        self.uploaded = None
+        self.calls = []
+        self.files = SimpleNamespace(upload=self._upload, content=self._content)
+        self.batches = SimpleNamespace(create=self._create, retrieve=self._retrieve)
+
+    def _upload(self, file, purpose, check):
+        self.calls.append('upload')
+        assert purpose == 'batch-api'
+        with open(file, encoding='utf-8') as f:
+            self.uploaded = [json.loads(line) for line in f]
+        return SimpleNamespace(id='file-in')
+
+    def _create(self, endpoint, input_file_id):
+        self.calls.append('create')
+        assert endpoint == '/v1/chat/completions' and input_file_id == 'file-in'
+        return BatchCreateResponse(job=BatchJob(id='batch-1', status='VALIDATING'), warning=self.warning)
+
+    def _retrieve(self, job_id):
+        self.calls.append('retrieve')
+        self.polls -= 1
+        if self.polls > 0:
+            return BatchJob(id=job_id, status='IN_PROGRESS')
+        return BatchJob(id=job_id, status='COMPLETED', output_file_id='file-out')
+
+    def _content(self, file_id):
+        self.calls.append('content')
+        assert file_id == 'file-out'
+        # Output order isn't guaranteed to match the input
+        lines = []
+        for record in reversed(self.uploaded):
+            content = self.reply(record['custom_id'], record['body']['messages'])
+            if content is not None:
+                response = {'status_code': 200, 'body': {'choices': [{'message': {'content': content}}]}}
+                lines.append(json.dumps({'custom_id': record['custom_id'], 'response': response}))
+        lines.append('not json')
+        return SimpleNamespace(text=lambda: '\n'.join(lines))
+
+
+def test_run_batch_job_round_trip(capsys):
+    client = FakeTogether(lambda custom_id, messages: None if custom_id == 'c' else f"reply to {custom_id}",
+                          warning='Deprecated model')
+    requests = {key: [{'role': 'user', 'content': key}] for key in ('a', 'b', 'c')}
+
+    results = run_batch_job(client, 'test-model', requests, poll_interval=0.001, timeout=5)
+
+    assert results == {'a': 'reply to a', 'b': 'reply to b'}
+    assert client.calls == ['upload', 'create', 'retrieve', 'retrieve', 'content']
+    assert [record['custom_id'] for record in client.uploaded] == ['a', 'b', 'c']
+    assert all(record['body']['model'] == 'test-model' for record in client.uploaded)
+    assert 'Deprecated model' in capsys.readouterr().out
+
+
+def test_generate_personas_batch_maps_results_back_to_users(monkeypatch):
+    monkeypatch.setenv('TOGETHER_BATCH_POLL_INTERVAL', '0.001')
+
+    def reply(custom_id, messages):
+        username = messages[-1]['content'].split('\n')[0].split(': ')[1]
+        return json.dumps({'name': f"{username} ({custom_id})", 'occupation': f"{username}'s job"})
+
+    generator = PersonaGenerator()
+    generator.client = FakeTogether(reply)
+    users = []
+    for username in ('alice', 'bob', 'carol'):
+        builder = ActivityFrameBuilder()
+        builder.add(POST, id=username, title='Hello', text=f"{username} writes", created_utc=0.0,
+                    subreddit='python', upvotes=1, url='')
+        users.append((username, builder.build()))
+    users.insert(1, ('nobody', ActivityFrameBuilder().build()))
+
+    personas = generator.generate_personas_batch(users, use_batch_job=True)
+
+    assert [persona['username'] for persona in personas] == ['alice', 'nobody', 'bob', 'carol']
+    assert personas[0]['occupation'] == "alice's job" and personas[0]['tier'] == 'llm'
+    assert personas[2]['occupation'] == "bob's job"
+    assert personas[3]['name'] == 'carol (persona-3)'
+    assert personas[1]['tier'] == 'heuristic'
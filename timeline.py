@@ -0,0 +1,183 @@
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import numpy as np
+
+from activity_frame import ActivityFrame
+
+DAY = 86400
+HOUR = 3600
+MONTH = 30 * DAY
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+# Local hours most people are asleep; the quietest UTC window is mapped onto it
+SLEEP_START_LOCAL = 1
+SLEEP_HOURS = 6
+
+
+def _date(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d')
+
+
+def hour_of_week_heatmap(times: np.ndarray) -> List[List[int]]:
+    """7x24 activity counts, rows Monday..Sunday, columns UTC hour."""
+    days = np.floor_divide(times, DAY).astype(np.int64)
+    # 1970-01-01 was a Thursday
+    weekday = (days + 3) % 7
+    hour = (np.floor_divide(times, HOUR) % 24).astype(np.int64)
+    return np.bincount(weekday * 24 + hour, minlength=7 * 24).reshape(7, 24).tolist()
+
+
+def detect_bursts(times: np.ndarray, min_items: int = 3, z: float = 2.0, limit: int = 10) -> List[Dict]:
+    """Runs of days with unusually high activity (more than ``z`` std above the daily mean)."""
+    if not len(times):
+        return []
+    days = np.floor_divide(times, DAY).astype(np.int64)
+    first = days.min()
+    daily = np.bincount(days - first)
+    threshold = max(min_items, daily.mean() + z * daily.std())
+    hot = daily >= threshold
+    if not hot.any():
+        return []
+
+    # Split consecutive hot days into runs
+    edges = np.diff(np.concatenate(([0], hot.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    cumulative = np.concatenate(([0], np.cumsum(daily)))
+    totals = cumulative[ends + 1] - cumulative[starts]
+
+    order = np.argsort(-totals, kind='stable')[:limit]
+    return [
+        {
+            'start': _date((first + starts[i]) * DAY),
+            'end': _date((first + ends[i]) * DAY),
+            'items': int(totals[i]),
+            'daily_baseline': round(float(daily.mean()), 2),
+        }
+        for i in order
+    ]
+
+
+def detect_sessions(times: np.ndarray, gap: float = 30 * 60) -> Dict:
+    """Group activity into sessions separated by more than ``gap`` seconds of silence."""
+    if not len(times):
+        return {'count': 0}
+    times = np.sort(times)
+    gaps = np.diff(times)
+    breaks = np.flatnonzero(gaps > gap)
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [len(times) - 1]))
+    durations = (times[ends] - times[starts]) / 60
+    sizes = ends - starts + 1
+    return {
+        'count': int(len(starts)),
+        'gap_minutes': gap / 60,
+        'median_duration_minutes': round(float(np.median(durations)), 1),
+        'longest_duration_minutes': round(float(durations.max()), 1),
+        'mean_items_per_session': round(float(sizes.mean()), 2),
+        'median_hours_between_sessions': round(float(np.median(gaps[breaks]) / HOUR), 1) if len(breaks) else None,
+    }
+
+
+def infer_timezone(hour_histogram: np.ndarray, min_items: int = 20) -> Dict:
+    """Guess the UTC offset by aligning the quietest 6-hour window with local night."""
+    total = int(hour_histogram.sum())
+    if total < min_items:
+        return {'utc_offset': None, 'label': 'Unknown', 'confidence': 0.0}
+
+    # Circular sliding-window sums over the 24 hours
+    wrapped = np.concatenate((hour_histogram, hour_histogram[:SLEEP_HOURS - 1]))
+    windows = np.convolve(wrapped, np.ones(SLEEP_HOURS, dtype=np.int64), mode='valid')[:24]
+    quiet = windows <= windows.min() + max(1, 0.01 * total)
+    if quiet.all():
+        quiet_start = int(np.argmin(windows))
+    else:
+        # Night is often longer than the window: take the middle of the longest quiet run
+        shift = int(np.flatnonzero(~quiet)[0])
+        rolled = np.roll(quiet, -shift).astype(np.int8)
+        edges = np.diff(np.concatenate(([0], rolled, [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        longest = int(np.argmax(ends - starts))
+        quiet_start = int((shift + (starts[longest] + ends[longest] - 1) // 2) % 24)
+    offset = (SLEEP_START_LOCAL - quiet_start) % 24
+    if offset > 12:
+        offset -= 24
+
+    # How much quieter the window is than a flat distribution would be
+    expected = total * SLEEP_HOURS / 24
+    confidence = max(0.0, 1 - windows[quiet_start] / expected)
+    sign = '+' if offset >= 0 else '-'
+    return {
+        'utc_offset': offset,
+        'label': f'UTC{sign}{abs(offset)}',
+        'quiet_hours_utc': f'{quiet_start}:00-{(quiet_start + SLEEP_HOURS) % 24}:00',
+        'confidence': round(float(confidence), 2),
+    }
+
+
+def subreddit_trends(frame: ActivityFrame, valid: np.ndarray, top: int = 5) -> List[Dict]:
+    """Monthly activity and trend direction for the most active subreddits."""
+    if not valid.any():
+        return []
+    times = frame.created_utc[valid]
+    sub_ids = frame.subreddit_ids[valid]
+    months = np.floor_divide(times - times.min(), MONTH).astype(np.int64)
+    n_months = int(months.max()) + 1
+
+    counts = np.bincount(sub_ids, minlength=len(frame.subreddits))
+    top_ids = np.argsort(-counts, kind='stable')[:top]
+    top_ids = top_ids[counts[top_ids] > 0]
+    rank = np.full(len(frame.subreddits), -1, dtype=np.int64)
+    rank[top_ids] = np.arange(len(top_ids))
+
+    # One bincount builds the (subreddit x month) matrix
+    keep = rank[sub_ids] >= 0
+    cells = rank[sub_ids[keep]] * n_months + months[keep]
+    matrix = np.bincount(cells, minlength=len(top_ids) * n_months).reshape(len(top_ids), n_months)
+
+    # Least-squares slope of monthly counts, for all subreddits at once
+    x = np.arange(n_months) - (n_months - 1) / 2
+    denom = float((x ** 2).sum())
+    slopes = matrix @ x / denom if denom else np.zeros(len(top_ids))
+    means = matrix.mean(axis=1)
+
+    trends = []
+    for i, sub_id in enumerate(top_ids):
+        if n_months < 2:
+            direction = 'steady'
+        elif slopes[i] > 0.1 * means[i]:
+            direction = 'rising'
+        elif slopes[i] < -0.1 * means[i]:
+            direction = 'falling'
+        else:
+            direction = 'steady'
+        name = frame.subreddits[sub_id]
+        trends.append({
+            'subreddit': 'unknown' if name is None else name,
+            'items': int(counts[sub_id]),
+            'monthly_counts': matrix[i].tolist(),
+            'slope_per_month': round(float(slopes[i]), 3),
+            'trend': direction,
+        })
+    return trends
+
+
+def build_timeline(frame: ActivityFrame, session_gap: float = 30 * 60, top_subreddits: int = 5) -> Dict:
+    """Activity rhythm analytics over a user's timestamps."""
+    valid = ~np.isnan(frame.created_utc)
+    times = frame.created_utc[valid]
+    if not len(times):
+        return {'items': 0}
+    return {
+        'items': int(len(times)),
+        'first_activity': _date(times.min()),
+        'last_activity': _date(times.max()),
+        'hour_of_week_heatmap_utc': hour_of_week_heatmap(times),
+        'weekday_order': list(WEEKDAYS),
+        'bursts': detect_bursts(times),
+        'sessions': detect_sessions(times, session_gap),
+        'timezone': infer_timezone(frame.hour_histogram()),
+        'subreddit_trends': subreddit_trends(frame, valid, top_subreddits),
+    }
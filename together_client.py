@@ -0,0 +1,93 @@
+import asyncio
+import os
+import threading
+
+import httpx
+from dotenv import load_dotenv
+from together import AsyncTogether, DefaultAsyncHttpxClient, DefaultHttpxClient, Together
+
+load_dotenv()
+
+_client = None
+_client_pid = None
+# Keyed by event loop. Not weak: each client's connection pool refers back to its loop
+_async_clients = {}
+_lock = threading.Lock()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv('TOGETHER_MAX_CONNECTIONS', 100)),
+        max_keepalive_connections=int(os.getenv('TOGETHER_MAX_KEEPALIVE', 100)),
+        keepalive_expiry=float(os.getenv('TOGETHER_KEEPALIVE_EXPIRY', 30)),
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    # No pool timeout: callers beyond max_connections queue for a connection
+    # instead of failing, and the read timeout still bounds each request
+    return httpx.Timeout(float(os.getenv('TOGETHER_TIMEOUT', 120)),
+                         connect=float(os.getenv('TOGETHER_CONNECT_TIMEOUT', 10)), pool=None)
+
+
+def _client_kwargs() -> dict:
+    return {
+        'api_key': os.getenv('TOGETHER_API_KEY'),
+        'base_url': os.getenv('TOGETHER_BASE_URL'),
+        'max_retries': int(os.getenv('TOGETHER_MAX_RETRIES', 2)),
+        'timeout': _timeout(),
+    }
+
+
+def get_together_client() -> Together:
+    """Return the process-wide Together client, sharing one keep-alive connection pool.
+
+    Rebuilt after a fork so worker processes never share sockets with the parent.
+    """
+    global _client, _client_pid
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = Together(http_client=DefaultHttpxClient(limits=_limits(), timeout=_timeout()),
+                               **_client_kwargs())
+            _client_pid = os.getpid()
+        return _client
+
+
+def create_async_together_client(**overrides) -> AsyncTogether:
+    """Return a new pooled AsyncTogether client; the caller must close it.
+
+    Use it as ``async with create_async_together_client() as client:`` for
+    work that runs on a short-lived loop, so its sockets are released with it.
+    """
+    kwargs = dict(_client_kwargs(), **overrides)
+    return AsyncTogether(http_client=DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout()), **kwargs)
+
+
+def get_async_together_client() -> AsyncTogether:
+    """Return the shared AsyncTogether client for the running event loop.
+
+    httpx async connections belong to the loop that opened them, so each loop
+    gets its own pooled client. Only use it from long-lived loops: nothing
+    closes it when its loop ends. Code that runs a loop per call (e.g.
+    ``asyncio.run``) should use ``create_async_together_client`` or await
+    ``aclose_async_together_client()`` before the loop ends.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        # Clients of loops that are gone can't be used (or closed) any more; drop them
+        for stale in [other for other in _async_clients if other.is_closed()]:
+            del _async_clients[stale]
+        entry = _async_clients.get(loop)
+        if entry is None or entry[0] != os.getpid():
+            entry = (os.getpid(), create_async_together_client())
+            _async_clients[loop] = entry
+        return entry[1]
+
+
+async def aclose_async_together_client():
+    """Close the running loop's shared client, if it has one, releasing its connections."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        entry = _async_clients.pop(loop, None)
+    if entry is not None and entry[0] == os.getpid():
+        await entry[1].close()